@@ -0,0 +1,21 @@
+"""
+Headless NumPy engine behind the desktop VPython simulations.
+
+The modules in this package do not import VPython, so the physics of the simulations can be evaluated (and checked)
+without opening a browser. The scripts in 'simulations/' only render the arrays returned here.
+
+    bloch: magnetization M(t) in B0 and under B1+ excitation (WCS and RRF)
+    rotation: exact rotation-operator propagation of M about Beff
+    relaxation: closed-form T1/T2 relaxation and a table of tissue parameters
+    ensemble: isochromat ensembles binned by off-resonance frequency (T2* dephasing)
+    fourier: vectorized Fourier series synthesis, closed-form coefficients and cached partial sums
+    gradients: ideal and concomitant gradient fields, Larmor frequency and phase-encoding maps on NumPy grids
+    diffusion: Monte Carlo random walk of spins under time-varying gradients (attenuation and b-value)
+    biot_savart: field of polyline coil windings (Maxwell pair, Golay coils) with a disk cache of field maps
+    contours: marching-squares isolines of sampled 2-D fields
+    cache: least-recently-used cache of computed arrays with a memory budget
+    sensitivity: dipole-approximation coil sensitivity profiles c(r) on NumPy grids
+    timing: sampling of the simulation time within the animation frames
+    spatial_hash: uniform-grid spatial hash of points for constant-time hit-testing, snapping and removal
+    plotting: batched hand-over of sampled curves to the VPython graphs, with bounded history
+"""
@@ -0,0 +1,173 @@
+"""
+Magnetic field of coil windings given as polylines, by the Biot-Savart law.
+
+Every straight segment from a to b (relative to the field point) carrying the current I contributes the exact field
+
+    B = mu0*I/(4*pi) * (a x b) * (|a| + |b|) / (|a|*|b|*(|a|*|b| + a.b))
+
+so a winding sampled as a polyline needs no numerical quadrature. The contributions of all segments are summed in one
+broadcast expression over (points, segments), processed in chunks of points to bound the memory. Field maps can be
+cached on disk, keyed by a hash of the coil geometry, the currents and the field points.
+
+The module also builds the classic gradient coils on a cylinder of radius R (SI units): the Maxwell pair for Gz and
+the Golay saddle coils for Gx and Gy, to compare their real field with the ideal gradient field of engine.gradients.
+Receive coils (surface loops, figure-eight coils, birdcage rungs) are built the same way; by reciprocity their
+sensitivity c(r) is their field per unit current.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from engine.gradients import gradient_field
+
+MU0 = 4E-7 * np.pi  # T*m/A
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'mri_biot_savart')
+
+
+def circular_arc(radius, z, phi_start, phi_end, n_segments=64):
+    """Polyline (n_segments + 1, 3) of the arc of radius 'radius' at height z from phi_start to phi_end (rad)."""
+    phi = np.linspace(phi_start, phi_end, n_segments + 1)
+    return np.column_stack((radius * np.cos(phi), radius * np.sin(phi), np.full_like(phi, z)))
+
+
+def maxwell_pair(radius, n_segments=128):
+    """Two loops at z = +-sqrt(3)/2*R with opposite currents (polylines and current signs): a z-gradient coil."""
+    d = np.sqrt(3) / 2 * radius
+    loops = [circular_arc(radius, z, 0, 2 * np.pi, n_segments) for z in (d, -d)]
+    return loops, np.array([1.0, -1.0])
+
+
+def golay_coil(radius, axis='x', n_segments=64):
+    """
+    Four saddle coils with 120 degree arcs at |z| = 0.389*R and 2.57*R (polylines and current signs): a transverse
+    gradient coil for 'axis' 'x' or 'y'. Each saddle is one closed polyline.
+    """
+    half_arc = np.pi / 3
+    rotation = 0 if axis == 'x' else np.pi / 2
+    saddles, signs = [], []
+    for phi_center, side_sign in ((0, 1.0), (np.pi, -1.0)):  # Opposite currents on opposite sides
+        for z_sign in (1, -1):
+            phi = rotation + phi_center
+            inner = circular_arc(radius, z_sign * 0.389 * radius, phi - half_arc, phi + half_arc, n_segments)
+            outer = circular_arc(radius, z_sign * 2.57 * radius, phi + half_arc, phi - half_arc, n_segments)
+            saddles.append(np.concatenate((inner, outer, inner[:1])))
+            signs.append(side_sign)
+    return saddles, np.array(signs)
+
+
+def square_loop(side, n_per_side=16):
+    """Square loop (polyline and current sign) of side 'side' in the x-y plane, counterclockwise (moment along +z)."""
+    t = np.linspace(-side / 2, side / 2, n_per_side + 1)[:-1]
+    h = np.full_like(t, side / 2)
+    corners = [(h, t), (-t, h), (-h, -t), (t, -h)]
+    loop = np.concatenate([np.column_stack((x, y, np.zeros_like(t))) for x, y in corners])
+    return [np.concatenate((loop, loop[:1]))], np.array([1.0])
+
+
+def figure_eight(radius, n_segments=128):
+    """Two touching loops of radius 'radius' centered at x = +-radius with opposite currents (x-y plane)."""
+    loops = [circular_arc(radius, 0, 0, 2 * np.pi, n_segments) + [center, 0, 0] for center in (radius, -radius)]
+    return loops, np.array([1.0, -1.0])
+
+
+def birdcage_rungs(radius, length, n_rungs=8):
+    """
+    Straight rungs parallel to z from -length/2 to length/2 at 'n_rungs' angles phi_k on a cylinder of radius 'radius',
+    with the currents cos(phi_k) of the homogeneous mode (transverse field along y inside the cage). The end rings are
+    left out.
+    """
+    phi = 2 * np.pi * np.arange(n_rungs) / n_rungs
+    rungs = [np.array([[radius * np.cos(p), radius * np.sin(p), -length / 2],
+                       [radius * np.cos(p), radius * np.sin(p), length / 2]]) for p in phi]
+    return rungs, np.cos(phi)
+
+
+def along_x(polylines):
+    """The polylines rotated so that their z-axis points along x (x, y, z -> y, z, x): e.g. loops in the y-z plane."""
+    return [np.asarray(line)[:, [2, 0, 1]] for line in polylines]
+
+
+def _segments(polylines, currents):
+    """Start points, end points and currents of all segments of the polylines."""
+    currents = np.broadcast_to(np.asarray(currents, dtype=float), (len(polylines),))
+    starts = np.concatenate([np.asarray(line, dtype=float)[:-1] for line in polylines])
+    ends = np.concatenate([np.asarray(line, dtype=float)[1:] for line in polylines])
+    segment_currents = np.concatenate([np.full(len(line) - 1, current) for line, current in zip(polylines, currents)])
+    return starts, ends, segment_currents
+
+
+def biot_savart(polylines, currents, points, chunk_bytes=64 * 2 ** 20):
+    """
+    Field B (n_points, 3) in T at 'points' (n_points, 3) of the polylines (list of (n_i, 3) arrays, m) carrying the
+    currents (A, one per polyline or a scalar). 'chunk_bytes' bounds the memory of the (points, segments) arrays.
+    """
+    starts, ends, segment_currents = _segments(polylines, currents)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    B = np.empty_like(points)
+    chunk = max(1, chunk_bytes // (len(starts) * 8 * 16))
+    for start in range(0, len(points), chunk):
+        p = points[start:start + chunk, None, :]
+        a = starts - p
+        b = ends - p
+        na = np.linalg.norm(a, axis=-1)
+        nb = np.linalg.norm(b, axis=-1)
+        denominator = na * nb * (na * nb + np.einsum('psk,psk->ps', a, b))
+        # Points on a winding (zero denominator) get no contribution from that segment
+        factor = np.divide(segment_currents * (na + nb), denominator, out=np.zeros_like(na),
+                           where=denominator > 1E-30)
+        B[start:start + chunk] = np.einsum('ps,psk->pk', factor, np.cross(a, b))
+    return MU0 / (4 * np.pi) * B
+
+
+def geometry_hash(polylines, currents, points):
+    """Hex digest identifying the coil geometry, the currents and the field points."""
+    digest = hashlib.sha1()
+    for array in list(polylines) + [currents, points]:
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def field_map(polylines, currents, points, cache_dir=CACHE_DIR, chunk_bytes=64 * 2 ** 20):
+    """
+    biot_savart() with a disk cache in 'cache_dir' (None disables it): maps are stored as .npy files named by
+    geometry_hash(), so a coil is only integrated once per grid.
+    """
+    if cache_dir is None:
+        return biot_savart(polylines, currents, points, chunk_bytes)
+    path = os.path.join(cache_dir, geometry_hash(polylines, currents, points) + '.npy')
+    if os.path.exists(path):
+        return np.load(path)
+    B = biot_savart(polylines, currents, points, chunk_bytes)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = path + '.{}.tmp'.format(os.getpid())
+    with open(temporary_path, 'wb') as file:
+        np.save(file, B)
+    os.replace(temporary_path, path)  # Complete files only, even with several processes writing
+    return B
+
+
+def center_gradient(polylines, currents, axis, h=1E-4):
+    """Gradient dBz/d'axis' (T/m) at the isocenter, by a central difference over +-h (m)."""
+    offset = np.zeros(3)
+    offset['xyz'.index(axis)] = h
+    Bz = biot_savart(polylines, currents, np.array([offset, -offset]))[:, 2]
+    return (Bz[0] - Bz[1]) / (2 * h)
+
+
+def linearity_deviation(Bz, G, x, y, z, tolerance=1E-9):
+    """
+    Relative deviation Bz/(G.r) - 1 of a real gradient field from the ideal field G.r (e.g. with G from
+    center_gradient()); NaN where the ideal field is zero. The linearity region is where it stays within a tolerance.
+    The ideal field counts as zero below 'tolerance' * |G| * |r|, so that the numerically tiny off-axis components of a
+    measured G do not make up a field on the symmetry planes.
+    """
+    ideal = np.asarray(gradient_field(G, x, y, z), dtype=float)
+    Bz = np.reshape(Bz, ideal.shape)
+    r = np.sqrt(np.asarray(x, dtype=float) ** 2 + np.asarray(y, dtype=float) ** 2 + np.asarray(z, dtype=float) ** 2)
+    nonzero = np.abs(ideal) > tolerance * np.linalg.norm(np.asarray(G, dtype=float)) * np.broadcast_to(r, ideal.shape)
+    return np.divide(Bz, ideal, out=np.full(ideal.shape, np.nan), where=nonzero) - 1
@@ -0,0 +1,67 @@
+"""
+Vectorized evaluation of the magnetization M(t) shown in simulations s01-s04.
+
+Every function broadcasts its arguments against each other and returns the components of M in a trailing axis of
+length 3. One call therefore serves both the animation loops (scalar time, one spin -> shape (3,)) and the lab
+exercises (e.g. t[:, None] against arrays of spin parameters -> shape (n_t, n_spins, 3)).
+
+Conventions (the same as in the original animations):
+    - M rotates right-handedly about the (effective) field by the angle w*t.
+    - Angular frequencies and times only need consistent units. The scripts pass frames and rad/frame.
+"""
+
+import numpy as np
+
+
+def _stack(mx, my, mz):
+    mx, my, mz = np.broadcast_arrays(mx, my, mz)
+    return np.stack((mx, my, mz), axis=-1)
+
+
+def free_precession(t, w0, flip_angle, phase=0.0, m0=1.0):
+    """
+    M(t) of a spin tilted 'flip_angle' (rad) away from the z-axis that precesses about B0 with angular frequency w0.
+    'phase' is the azimuth of M at t = 0.
+    """
+    angle = np.multiply(w0, t) + phase
+    m_transverse = np.multiply(m0, np.sin(flip_angle))
+    return _stack(m_transverse * np.cos(angle), m_transverse * np.sin(angle), np.multiply(m0, np.cos(flip_angle)))
+
+
+def effective_field_axis(w1, delta_w=0.0, b1_phase=0.0):
+    """
+    Unit axis and angular frequency |w_eff| of the effective field in the RRF, w_eff = (w1*cos, w1*sin, delta_w).
+    Where w_eff vanishes the z-axis is returned, so that a rotation by |w_eff|*t = 0 is still well defined.
+    """
+    w1, delta_w, b1_phase = np.broadcast_arrays(*(np.asarray(value, dtype=float) for value in (w1, delta_w, b1_phase)))
+    w_eff = np.sqrt(w1 ** 2 + delta_w ** 2)
+    safe_w_eff = np.where(w_eff > 0, w_eff, 1.0)
+    n_z = np.where(w_eff > 0, delta_w / safe_w_eff, 1.0)
+    axis = _stack(w1 * np.cos(b1_phase) / safe_w_eff, w1 * np.sin(b1_phase) / safe_w_eff, n_z)
+    return axis, w_eff
+
+
+def rrf_excitation(t, w1, delta_w=0.0, b1_phase=0.0, m0=1.0):
+    """
+    M(t) in the rotating reference frame for a spin starting at M0*e_z under a B1+ field of angular frequency w1 and
+    phase 'b1_phase'. 'delta_w' = w0 - w_HF is the off-resonance (0 under the resonance condition).
+    """
+    axis, w_eff = effective_field_axis(w1, delta_w, b1_phase)
+    angle = w_eff * t
+    c = np.cos(angle)
+    s = np.sin(angle)
+    n_x, n_y, n_z = axis[..., 0], axis[..., 1], axis[..., 2]
+
+    # Rodrigues' rotation of e_z about the effective field axis
+    mx = n_x * n_z * (1 - c) + n_y * s
+    my = n_y * n_z * (1 - c) - n_x * s
+    mz = c + n_z ** 2 * (1 - c)
+    return np.asarray(m0)[..., None] * _stack(mx, my, mz)
+
+
+def rrf_to_wcs(m, frame_angle):
+    """Transforms vectors m (..., 3) from the RRF to the WCS, the RRF being rotated by 'frame_angle' about z."""
+    m = np.asarray(m, dtype=float)
+    c = np.cos(frame_angle)
+    s = np.sin(frame_angle)
+    return _stack(c * m[..., 0] - s * m[..., 1], s * m[..., 0] + c * m[..., 1], m[..., 2])
@@ -0,0 +1,78 @@
+"""
+Least-recently-used cache with a memory budget.
+
+Results that are expensive to compute but revisited often (e.g. the geometry of slider configurations a user flicks
+back and forth between) are kept until the estimated memory of all entries exceeds the budget; then the entries used
+least recently are evicted first. The memory of an entry is estimated from the NumPy arrays it holds (see 'nbytes').
+"""
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(value):
+    """Approximate memory in bytes of an array, a scalar or (nested) tuples, lists and dicts of them."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(nbytes(item) for item in value)
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(key) + nbytes(item) for key, item in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Maps hashable keys to values, keeping at most about 'max_bytes' of values (least recently used evicted first)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: (value, size in bytes), least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """The value of 'key' (which becomes the most recently used entry) or 'default'."""
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value):
+        """Stores 'value' under 'key' and evicts the least recently used entries beyond the budget."""
+        self.discard(key)
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+
+    def get_or_compute(self, key, compute):
+        """The cached value of 'key', or the result of compute() after storing it."""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def discard(self, key):
+        """Removes 'key' if present."""
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
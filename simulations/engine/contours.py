@@ -0,0 +1,106 @@
+"""
+Isolines of a sampled 2-D field by marching squares.
+
+The field is given on a grid of samples (m, n) together with the position of every sample (m, n, d), e.g. the 3-D
+scene coordinates of a lattice plane. For all requested levels at once, the crossings of the level on every grid edge
+are interpolated linearly and joined into one segment per cell (two in the saddle cases, resolved by the value at the
+cell centre). The segments of each level are then chained into polylines.
+
+Samples exactly at a level count as above it, so isolines through grid samples (e.g. of linear gradient fields on
+their own lattice) are found without special cases; the zero-length segments this produces at single samples are
+dropped.
+"""
+
+import numpy as np
+
+# Edges of a cell with the corners p00 = [i, j], p01 = [i, j+1], p11 = [i+1, j+1] and p10 = [i+1, j]:
+# 0: p00-p01, 1: p01-p11, 2: p10-p11, 3: p00-p10. Segments cutting off a single corner in the saddle cases:
+_SADDLE_SEGMENTS_P00_P11 = np.array([[3, 0], [1, 2]])
+_SADDLE_SEGMENTS_P01_P10 = np.array([[0, 1], [2, 3]])
+
+
+def _crossing(fa, fb, pa, pb):
+    """Linear interpolation of the zero crossing between the samples a and b (the level subtracted from f)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.nan_to_num(np.clip(fa / (fa - fb), 0, 1))
+    return pa + t[..., None] * (pb - pa)
+
+
+def isoline_segments(field, points, levels):
+    """
+    Segments (k, 2, d) of the isolines of 'field' (m, n) sampled at 'points' (m, n, d) at all 'levels', and the
+    index into 'levels' of each segment (k,).
+    """
+    field = np.asarray(field, dtype=float)
+    points = np.asarray(points, dtype=float)
+    levels = np.atleast_1d(np.asarray(levels, dtype=float))
+
+    f = field[None] - levels[:, None, None]
+    f00, f01, f11, f10 = f[:, :-1, :-1], f[:, :-1, 1:], f[:, 1:, 1:], f[:, 1:, :-1]
+    p00, p01, p11, p10 = points[:-1, :-1], points[:-1, 1:], points[1:, 1:], points[1:, :-1]
+    a00, a01, a11, a10 = f00 >= 0, f01 >= 0, f11 >= 0, f10 >= 0
+
+    # Crossings of the level on the four edges of every cell: (levels, m-1, n-1, 4, d)
+    edge_points = np.stack((_crossing(f00, f01, p00, p01), _crossing(f01, f11, p01, p11),
+                            _crossing(f10, f11, p10, p11), _crossing(f00, f10, p00, p10)), axis=-2)
+    crossed = np.stack((a00 != a01, a01 != a11, a10 != a11, a00 != a10), axis=-1)
+    n_crossed = crossed.sum(axis=-1)
+
+    # Cells crossed once: the segment joins the two crossed edges
+    cells = np.nonzero(n_crossed == 2)
+    first = np.argmax(crossed[cells], axis=-1)
+    second = 3 - np.argmax(crossed[cells][:, ::-1], axis=-1)
+    single = np.stack((edge_points[cells + (first,)], edge_points[cells + (second,)]), axis=1)
+
+    # Saddle cells: the two corners on the other side than the cell centre are cut off
+    saddles = np.nonzero(n_crossed == 4)
+    centre_above = (f00 + f01 + f11 + f10)[saddles] >= 0
+    pairs = np.where((a00[saddles] != centre_above)[:, None, None], _SADDLE_SEGMENTS_P00_P11,
+                     _SADDLE_SEGMENTS_P01_P10)
+    saddle_edges = edge_points[saddles]  # (k, 4, d)
+    double = np.take_along_axis(saddle_edges[:, None], pairs[..., None], axis=2)  # (k, 2, 2, d)
+
+    segments = np.concatenate((single, double.reshape(-1, 2, points.shape[-1])))
+    segment_levels = np.concatenate((cells[0], np.repeat(saddles[0], 2)))
+    return segments, segment_levels
+
+
+def _chain(segments, tolerance):
+    """Joins segments (k, 2, d) that share end points into polylines."""
+    keys = [tuple(key) for key in np.round(segments.reshape(-1, segments.shape[-1]) / tolerance).astype(np.int64)]
+    ends = {}
+    for index, key in enumerate(keys):
+        ends.setdefault(key, []).append(index)
+
+    used = np.zeros(len(segments), dtype=bool)
+    polylines = []
+    # Open lines start at an end point of a single segment; what is left are closed loops
+    starts = [index for index, key in enumerate(keys) if len(ends[key]) == 1] + list(range(len(keys)))
+    for start in starts:
+        if used[start // 2]:
+            continue
+        line = [segments[start // 2, start % 2]]
+        end = start
+        while True:
+            used[end // 2] = True
+            other = end ^ 1  # The other end point of the same segment
+            line.append(segments[other // 2, other % 2])
+            following = [index for index in ends[keys[other]] if not used[index // 2]]
+            if not following:
+                break
+            end = following[0]
+        polylines.append(np.array(line))
+    return polylines
+
+
+def isolines(field, points, levels):
+    """
+    Isolines of 'field' (m, n) sampled at 'points' (m, n, d): for each of 'levels' a list of polylines (p, d).
+    A straight level line of a linear field is a single polyline.
+    """
+    points = np.asarray(points, dtype=float)
+    segments, segment_levels = isoline_segments(field, points, levels)
+    tolerance = 1E-6 * max(np.ptp(points.reshape(-1, points.shape[-1]), axis=0).max(), 1E-12)
+    keep = np.linalg.norm(segments[:, 1] - segments[:, 0], axis=-1) > tolerance
+    segments, segment_levels = segments[keep], segment_levels[keep]
+    return [_chain(segments[segment_levels == level], tolerance) for level in range(len(np.atleast_1d(levels)))]
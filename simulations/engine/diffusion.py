@@ -0,0 +1,77 @@
+"""
+Monte Carlo simulation of diffusion weighting by the ideal gradient field.
+
+Spins start at the origin and random-walk freely with Gaussian steps of variance 2*D*dt per axis while a time-varying
+gradient G(t) is applied. In the ideal gradient field (see engine.gradients) a spin at r(t) accumulates the phase
+
+    phi = gamma * integral(G(t) . r(t) dt)
+
+and the signal is the mean of exp(i*phi) over the spins. Since r(t_k) is the sum of the steps xi_j with j <= k, the
+phase is a weighted sum of the steps, phi = gamma * dt * sum_j xi_j . F_j with F_j = sum_{k >= j} G(t_k), so each chunk
+of spins takes one matrix product instead of a loop over time. Spins are processed in chunks of bounded memory and the
+chunks can be split across processes; the result only depends on the seed, not on the number of processes.
+
+Units are SI: G in T/m, dt in s, D in m^2/s, b in s/m^2.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine.gradients import GAMMA_PROTONS
+
+
+def stejskal_tanner_waveform(G, small_delta, big_delta, dt):
+    """
+    Effective gradient (n_steps, 3) of a pulsed-gradient spin echo: lobes of strength G (3-vector, T/m) and duration
+    'small_delta' starting at t = 0 and t = 'big_delta', the second one inverted by the refocusing pulse.
+    """
+    t = np.arange(int(round((big_delta + small_delta) / dt))) * dt + dt / 2
+    sign = np.where(t < small_delta, 1.0, 0.0) - np.where(t >= big_delta, 1.0, 0.0)
+    return sign[:, None] * np.asarray(G, dtype=float)
+
+
+def b_value(G, dt, gamma=GAMMA_PROTONS):
+    """b = gamma^2 * integral(|k(t)|^2 dt) of the gradient waveform G (n_steps, 3), with k(t) = integral_0^t G."""
+    k = np.cumsum(G, axis=0) * dt
+    return gamma ** 2 * np.sum(k ** 2) * dt
+
+
+def _phase_weights(G, dt, D, gamma):
+    """Weights w (3 * n_steps,) such that phi = xi . w for standard normal steps xi of one spin."""
+    F = np.cumsum(G[::-1], axis=0)[::-1]
+    return (gamma * dt * np.sqrt(2 * D * dt) * F).ravel()
+
+
+def _chunk_signal(args):
+    """Sum of exp(i*phi) over one chunk of spins."""
+    weights, n_spins, seed = args
+    rng = np.random.default_rng(seed)
+    steps = rng.standard_normal((n_spins, len(weights)), dtype=np.float32)
+    phi = steps @ weights.astype(np.float32)
+    return np.sum(np.exp(1j * phi.astype(float)))
+
+
+def diffusion_signal(G, dt, D, n_spins=10 ** 6, gamma=GAMMA_PROTONS, chunk_bytes=64 * 2 ** 20, processes=None,
+                     seed=None):
+    """
+    Monte Carlo signal S/S0 (complex) of 'n_spins' spins diffusing with coefficient D under the gradient waveform G
+    (n_steps, 3) sampled every dt, and its b-value. The attenuation abs(S/S0) approaches exp(-b*D) for free diffusion
+    and a waveform without net area (as in a spin echo).
+
+    'chunk_bytes' bounds the memory of the random steps of one chunk of spins; 'processes' > 1 splits the chunks
+    across a process pool (scripts using it must guard their entry point with if __name__ == '__main__').
+    """
+    G = np.atleast_2d(np.asarray(G, dtype=float))
+    weights = _phase_weights(G, dt, D, gamma)
+    chunk = max(1, chunk_bytes // (len(weights) * 4))
+    sizes = [min(chunk, n_spins - start) for start in range(0, n_spins, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(weights, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+    if processes is not None and processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            total = sum(pool.map(_chunk_signal, tasks))
+    else:
+        total = sum(map(_chunk_signal, tasks))
+    return total / n_spins, b_value(G, dt, gamma)
@@ -0,0 +1,74 @@
+"""
+Isochromat ensembles with frequency binning for T2* dephasing.
+
+Spins that share (up to the bin width) the same off-resonance frequency precess identically, so an ensemble of any
+number of nominal spins is represented by the distinct bin frequencies and the number of spins in each bin. The net
+magnetization is then the weighted mean over a few thousand bins instead of a sum over millions of spins.
+
+B0 inhomogeneity is modelled by a Lorentzian (FID decays as exp(-width*t), i.e. T2* = 1/width) or a Gaussian
+(FID decays as exp(-(width*t)**2/2)) distribution of the off-resonance frequency.
+"""
+
+import numpy as np
+
+DISTRIBUTIONS = ('lorentzian', 'gaussian')
+
+
+def offset_pdf(kind, offsets, width=1.0):
+    """Probability density of the off-resonance frequency ('width': HWHM of the Lorentzian, sigma of the Gaussian)."""
+    if kind == 'lorentzian':
+        return width / (np.pi * (offsets ** 2 + width ** 2))
+    elif kind == 'gaussian':
+        return np.exp(-0.5 * (offsets / width) ** 2) / (width * np.sqrt(2 * np.pi))
+    raise ValueError(f"Unknown distribution '{kind}', expected one of {DISTRIBUTIONS}")
+
+
+def sample_offsets(kind, n_spins, width=1.0, rng=None):
+    """Draws the off-resonance frequencies of 'n_spins' individual spins."""
+    rng = np.random.default_rng(rng)
+    if kind == 'lorentzian':
+        return width * rng.standard_cauchy(n_spins)
+    elif kind == 'gaussian':
+        return width * rng.standard_normal(n_spins)
+    raise ValueError(f"Unknown distribution '{kind}', expected one of {DISTRIBUTIONS}")
+
+
+class IsochromatEnsemble:
+    """Distinct off-resonance frequencies 'offsets' (n_bins,) and the number of spins 'weights' (n_bins,) of each."""
+
+    def __init__(self, offsets, weights):
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.fractions = self.weights / self.weights.sum()
+
+    @property
+    def n_spins(self):
+        return self.weights.sum()
+
+    @classmethod
+    def from_samples(cls, offsets, n_bins=2001, span=None):
+        """Merges individual spin frequencies into 'n_bins' bins over [-span, span], dropping the empty bins."""
+        offsets = np.asarray(offsets, dtype=float)
+        if span is None:
+            span = np.abs(offsets).max()
+        counts, edges = np.histogram(offsets, bins=n_bins, range=(-span, span))
+        centers = (edges[:-1] + edges[1:]) / 2
+        occupied = counts > 0
+        return cls(centers[occupied], counts[occupied])
+
+    @classmethod
+    def from_distribution(cls, kind='lorentzian', width=1.0, n_bins=2001, n_spins=10 ** 7, span=None):
+        """
+        Bins 'n_spins' nominal spins of a Lorentzian or Gaussian distribution without drawing them. The default
+        'span' covers the distribution up to 50 HWHM (Lorentzian) or 5 sigma (Gaussian). The bin spacing d sets the
+        time 2*pi/d after which the binned ensemble rephases.
+        """
+        if span is None:
+            span = (50 if kind == 'lorentzian' else 5) * width
+        centers = np.linspace(-span, span, n_bins)
+        probability = offset_pdf(kind, centers, width)
+        return cls(centers, n_spins * probability / probability.sum())
+
+    def net_magnetization(self, M):
+        """Weighted mean of the magnetization M (..., n_bins, 3) of the bins, i.e. the signal of the whole ensemble."""
+        return np.einsum('k,...ki->...i', self.fractions, M)
@@ -0,0 +1,117 @@
+"""
+Vectorized Fourier series of functions with period L, evaluated on [-L/2, L/2].
+
+The partial sum of the complex series is
+
+    s_N(x) = sum_{n=-N}^{N} c_n * exp(i*2*pi*n*x/L)
+
+For a real f(x) the coefficients satisfy c_-n = conj(c_n), so s_N(x) = c_0 + 2*Re(sum_{n=1}^{N} c_n*exp(i*2*pi*n*x/L)).
+The terms for all x and n are evaluated as one basis matrix (n_points, N) and summed with a single matrix product, so
+the cost per update is a few NumPy calls even for thousands of terms.
+
+Functions without closed-form coefficients (a Python callable, an array of samples or a .npy file) are sampled at M
+points over one period; their coefficients follow from an FFT and s_N from an inverse FFT, both O(M log M).
+"""
+
+import numpy as np
+
+
+def basis_matrix(x, n_max, L):
+    """
+    exp(i*2*pi*n*x/L) for all x (n_points,) and n = 1, ..., n_max, shape (n_points, n_max). The columns are the
+    powers of the fundamental exp(i*2*pi*x/L), built by a cumulative product, which is much cheaper than an exp() per
+    element.
+    """
+    fundamental = np.exp(2j * np.pi * np.asarray(x, dtype=float) / L)
+    return np.cumprod(np.broadcast_to(fundamental[:, None], (len(fundamental), n_max)), axis=1)
+
+
+def partial_sum(x, coefficients, L):
+    """s_N(x) of a real function from its coefficients c_0, c_1, ..., c_N (N + 1,)."""
+    coefficients = np.asarray(coefficients)
+    return coefficients[0].real + 2 * (basis_matrix(x, len(coefficients) - 1, L) @ coefficients[1:]).real
+
+
+def sign_coefficients(n):
+    """c_n of f(x) = sign(x): -2i/(n*pi) for odd n, 0 otherwise."""
+    n = np.asarray(n)
+    c = np.zeros(n.shape, dtype=complex)
+    odd = n % 2 == 1
+    c[odd] = -2j / (np.pi * n[odd])
+    return c
+
+
+def ramp_coefficients(n):
+    """c_n of f(x) = x/L: i*(-1)^n/(2*pi*n) for n != 0, c_0 = 0."""
+    n = np.asarray(n)
+    c = np.zeros(n.shape, dtype=complex)
+    nonzero = n != 0
+    c[nonzero] = 1j * np.where(n[nonzero] % 2 == 0, 1, -1) / (2 * np.pi * n[nonzero])
+    return c
+
+
+class PartialSums:
+    """
+    s_N(x) of a real function for every N = 0, ..., n_max, precomputed from its coefficients c_0, ..., c_n_max.
+
+    The terms of all orders are evaluated once as a basis matrix and accumulated with a cumulative sum, so looking up
+    s_N for another N (e.g. while moving a slider) is an array index instead of a new summation. The table holds
+    (n_max + 1) * n_points values; it belongs to one function and is rebuilt when the function changes.
+    """
+
+    def __init__(self, x, coefficients, L):
+        coefficients = np.asarray(coefficients)
+        self.n_max = len(coefficients) - 1
+        terms = 2 * (basis_matrix(x, self.n_max, L) * coefficients[1:]).real
+        self._sums = np.empty((self.n_max + 1, len(terms)))
+        self._sums[0] = coefficients[0].real
+        np.cumsum(terms.T, axis=0, out=self._sums[1:])
+        self._sums[1:] += coefficients[0].real
+
+    def __getitem__(self, N):
+        """s_N(x) for all x (n_points,)."""
+        return self._sums[N]
+
+
+def periodic_grid(n_points, L):
+    """n_points equidistant x over one period [-L/2, L/2), without the repeated end point."""
+    return -L / 2 + L * np.arange(n_points) / n_points
+
+
+def periodic_samples(source, L, n_samples=2 ** 16):
+    """
+    Samples of f(x) over one period for 'fft_coefficients'. 'source' is a callable f(x) (evaluated on
+    'periodic_grid(n_samples, L)'), an array of samples over [-L/2, L/2) or the path of a .npy file holding one.
+    """
+    if isinstance(source, str):
+        source = np.load(source)
+    elif callable(source):
+        source = source(periodic_grid(n_samples, L))
+    samples = np.asarray(source, dtype=float)
+    if samples.ndim != 1 or len(samples) < 2:
+        raise ValueError(f"Expected a 1-D array of samples over one period, got shape {samples.shape}")
+    return samples
+
+
+def fft_coefficients(samples, n_max):
+    """
+    c_0, ..., c_N of a real function from its samples over [-L/2, L/2), with N = min(n_max, M/2) for M samples.
+    The FFT assumes the samples start at x = 0; starting at -L/2 multiplies c_n by (-1)^n. For even M the bin M/2
+    holds both c_M/2 and c_-M/2, so it is halved to be counted once by the series.
+    """
+    spectrum = np.fft.rfft(samples)[:n_max + 1] / len(samples)
+    spectrum[1::2] *= -1
+    if len(samples) % 2 == 0 and n_max >= len(samples) // 2:
+        spectrum[len(samples) // 2] /= 2
+    return spectrum
+
+
+def fft_partial_sum(coefficients, n_points, L):
+    """
+    s_N(x) on 'periodic_grid(n_points, L)' from c_0, ..., c_N by an inverse FFT. The spectrum is zero-padded to a
+    multiple of n_points longer than 2N, so the series is not aliased for any N, and then taken at every n_points-th x.
+    """
+    coefficients = np.array(coefficients, dtype=complex)
+    coefficients[1::2] *= -1
+    n_fft = n_points * (2 * len(coefficients) // n_points + 1)
+    return np.fft.irfft(coefficients, n_fft)[::n_fft // n_points] * n_fft
@@ -0,0 +1,71 @@
+"""
+Ideal linear gradient fields evaluated on NumPy grids.
+
+The z-component of the field of ideal gradients G = (Gx, Gy, Gz) on top of the main field B0 is
+
+    B(r) = B0 + G.r = B0 + Gx*x + Gy*y + Gz*z
+
+and the Larmor angular frequency is w(r) = gamma*B(r). Both are single broadcast expressions: coordinates may be
+full meshgrids, sparse (open) meshgrids as returned by 'lattice' or any other arrays that broadcast against each
+other, so maps of 256^3 voxels need no Python loops.
+"""
+
+import numpy as np
+
+GAMMA_PROTONS = 2.67513E8  # rad/(s*T)
+
+
+def lattice(x, y, z, sparse=True):
+    """
+    Grid of the 1-D coordinates x, y and z (indexing 'ij', i.e. arrays[i, j, k] belong to x[i], y[j], z[k]). The
+    sparse grid only stores the coordinate vectors and broadcasts to the full (len(x), len(y), len(z)) volume.
+    """
+    return np.meshgrid(x, y, z, indexing='ij', sparse=sparse)
+
+
+def gradient_field(G, x, y, z, B0=0.0):
+    """B0 + G.r for the gradient strengths G = (Gx, Gy, Gz) at the coordinates x, y and z."""
+    Gx, Gy, Gz = G
+    return B0 + Gx * np.asarray(x) + Gy * np.asarray(y) + Gz * np.asarray(z)
+
+
+def larmor_frequency(G, x, y, z, B0=0.0, gamma=GAMMA_PROTONS, dtype=float):
+    """
+    w(r) = gamma*(B0 + G.r) in rad/s (SI units: T, T/m and m). 'dtype' float32 halves the memory of large maps.
+    """
+    Gx, Gy, Gz = (np.asarray(g, dtype=dtype) for g in G)
+    x, y, z = (np.asarray(c, dtype=dtype) for c in (x, y, z))
+    return dtype(gamma) * gradient_field((Gx, Gy, Gz), x, y, z, dtype(B0))
+
+
+def phase_encoding_gradients(fov, matrix_size, tau, gamma=GAMMA_PROTONS):
+    """
+    Strengths n*dG (T/m) of the phase-encoding steps n = -N/2, ..., N/2 - 1 for N = 'matrix_size', with
+    dG = 2*pi/(gamma*tau*fov) so that neighbouring steps differ by 1/fov in k-space (gradient duration 'tau').
+    """
+    return (np.arange(matrix_size) - matrix_size // 2) * 2 * np.pi / (gamma * tau * fov)
+
+
+def phase_maps(G, x, y, z, tau, gamma=GAMMA_PROTONS, dtype=np.complex64):
+    """
+    Stack of the phase factors exp(-i*gamma*(G.r)*tau) for a list of gradients G (n_steps, 3), evaluated in one call:
+    the result has the shape (n_steps,) + the broadcast shape of x, y and z.
+    """
+    G = np.atleast_2d(G)
+    expand = (slice(None),) + (None,) * np.broadcast(x, y, z).ndim
+    phase = gamma * tau * gradient_field([G[:, i][expand] for i in range(3)], x, y, z)
+    return np.exp(-1j * phase).astype(dtype)
+
+
+def concomitant_field(G, x, y, z, B0):
+    """
+    Lowest-order concomitant (Maxwell) field of the gradients G = (Gx, Gy, Gz) in the main field B0 (SI units):
+
+        B_c(r) = ((Gx*z - Gz*x/2)^2 + (Gy*z - Gz*y/2)^2) / (2*B0)
+
+    The ideal field B0 + G.r violates Maxwell's equations (div B = 0, curl B = 0) on its own; B_c is the leading
+    correction to the magnitude of the field and adds to it.
+    """
+    Gx, Gy, Gz = G
+    x, y, z = (np.asarray(c) for c in (x, y, z))
+    return ((Gx * z - Gz * x / 2) ** 2 + (Gy * z - Gz * y / 2) ** 2) / (2 * B0)
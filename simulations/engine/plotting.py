@@ -0,0 +1,142 @@
+"""
+Helpers to hand sampled curves to the VPython graphs in batches.
+
+The module only formats and buffers the points; the gcurve objects are created by the simulations and passed in.
+"""
+
+import numpy as np
+
+
+def curve_points(x, y):
+    """List of [x, y] pairs, the format in which gcurve.plot() accepts many points in a single call."""
+    x, y = np.broadcast_arrays(x, y)
+    return np.column_stack((x, y)).tolist()
+
+
+class BufferedCurve:
+    """
+    Wraps a VPython gcurve so that long-running graphs use constant memory in Python and in the browser.
+
+    Plotted samples are kept in a NumPy ring buffer of the 'capacity' most recent points and sent to the gcurve in one
+    batch every 'flush_every' calls of plot() (i.e. frames). Points that leave the ring buffer are folded into a min/max
+    envelope of at most 'envelope_size' buckets of 'bucket_size' samples; when the envelope is full, neighbouring
+    buckets are merged and the bucket size doubles, so all buckets always span the same power-of-two multiple of
+    'bucket_size' samples. Once the browser holds about twice the capacity, the gcurve is redrawn from the envelope
+    and the ring buffer, which bounds the number of points it keeps.
+    """
+
+    def __init__(self, curve, capacity=4096, envelope_size=2048, bucket_size=16, flush_every=5):
+        self.curve = curve
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self._points = np.empty((capacity, 2))
+        self._envelope = np.empty((envelope_size, 3))  # x, y min, y max of each bucket
+        self._initial_bucket_size = bucket_size
+        self._clear()
+
+    def _clear(self):
+        self._start = 0  # Ring buffer index of the oldest point
+        self._count = 0  # Points in the ring buffer
+        self._pending = 0  # Newest points of the ring buffer not yet sent to the gcurve
+        self._shown = 0  # Points held by the gcurve in the browser
+        self._frames = 0
+        self._n_buckets = 0
+        self._bucket_size = self._initial_bucket_size
+        self._partial = None  # (x, y min, y max, samples) of the bucket being filled
+
+    def plot(self, x, y):
+        """Adds the samples y(x) of one frame; flushes them together with the previous frames every 'flush_every'."""
+        points = np.column_stack(np.broadcast_arrays(np.ravel(x), np.ravel(y))).astype(float)
+        for start in range(0, len(points), self.capacity):
+            self._write(points[start:start + self.capacity])
+        self._frames += 1
+        if self._frames >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Sends the pending points to the gcurve, or redraws it from the history if it holds too many points."""
+        self._frames = 0
+        if self._pending == 0:
+            return
+        new = self._take(self._start + self._count - self._pending, self._pending)
+        self._pending = 0
+        if self._shown + len(new) > 2 * (self.capacity + len(self._envelope)):
+            history = np.concatenate((self._envelope_points(), self._take(self._start, self._count)))
+            self.curve.delete()
+            self.curve.plot(history.tolist())
+            self._shown = len(history)
+        else:
+            self.curve.plot(new.tolist())
+            self._shown += len(new)
+
+    def delete(self):
+        """Deletes the gcurve and the buffered history."""
+        self.curve.delete()
+        self._clear()
+
+    def _take(self, start, n):
+        return self._points[(start + np.arange(n)) % self.capacity]
+
+    def _write(self, points):
+        n = len(points)
+        if self._pending + n > self.capacity:
+            self.flush()  # Points must be sent before they can leave the ring buffer
+        overflow = self._count + n - self.capacity
+        if overflow > 0:
+            self._fold(self._take(self._start, overflow))
+            self._start = (self._start + overflow) % self.capacity
+            self._count -= overflow
+        self._points[(self._start + self._count + np.arange(n)) % self.capacity] = points
+        self._count += n
+        self._pending += n
+
+    def _fold(self, points):
+        """Adds the points leaving the ring buffer to the min/max envelope."""
+        while len(points):
+            if self._partial is not None:
+                x, y_min, y_max, n = self._partial
+                head = points[:self._bucket_size - n, 1]
+                points = points[len(head):]
+                self._partial = (x, min(y_min, head.min()), max(y_max, head.max()), n + len(head))
+                if self._partial[3] == self._bucket_size:
+                    bucket, self._partial = self._partial, None
+                    self._push(np.array([bucket[:3]]))
+                continue
+
+            n_full = len(points) // self._bucket_size
+            if n_full:
+                full = points[:n_full * self._bucket_size].reshape(n_full, self._bucket_size, 2)
+                points = points[n_full * self._bucket_size:]
+                self._push(np.column_stack((full[:, 0, 0], full[:, :, 1].min(axis=1), full[:, :, 1].max(axis=1))))
+                continue
+
+            self._partial = (points[0, 0], points[:, 1].min(), points[:, 1].max(), len(points))
+            points = points[:0]
+
+    def _push(self, buckets):
+        """Appends complete buckets (no bucket may be partially filled) to the envelope."""
+        buckets = np.concatenate((self._envelope[:self._n_buckets], buckets))
+        while len(buckets) > len(self._envelope):
+            # Merging neighbouring buckets halves the resolution of the whole envelope. With an odd number of buckets
+            # the newest one becomes the partially filled bucket of the doubled size, so all buckets keep the same width
+            if len(buckets) % 2:
+                x, y_min, y_max = buckets[-1]
+                n = self._bucket_size
+                if self._partial is not None:
+                    n += self._partial[3]
+                    y_min, y_max = min(y_min, self._partial[1]), max(y_max, self._partial[2])
+                self._partial = (x, y_min, y_max, n)
+                buckets = buckets[:-1]
+            merged = np.column_stack((buckets[0::2, 0], np.minimum(buckets[0::2, 1], buckets[1::2, 1]),
+                                      np.maximum(buckets[0::2, 2], buckets[1::2, 2])))
+            buckets = merged
+            self._bucket_size *= 2
+        self._n_buckets = len(buckets)
+        self._envelope[:self._n_buckets] = buckets
+
+    def _envelope_points(self):
+        """The envelope as a zigzag between the minimum and the maximum of each bucket."""
+        buckets = self._envelope[:self._n_buckets]
+        if self._partial is not None:
+            buckets = np.concatenate((buckets, [self._partial[:3]]))
+        return np.stack((buckets[:, [0, 1]], buckets[:, [0, 2]]), axis=1).reshape(-1, 2)
@@ -0,0 +1,43 @@
+"""
+Closed-form T1/T2 relaxation of the magnetization during free precession in B0.
+
+The solution of the Bloch equations after an excitation by 'flip_angle' is evaluated analytically,
+
+    Mxy(t) = M0 * sin(flip_angle) * exp(-t/T2) * exp(i*(w0*t + phase))
+    Mz(t)  = M0 - M0 * (1 - cos(flip_angle)) * exp(-t/T1)
+
+so contrast curves of many voxels at arbitrary time points come from a single broadcast call, e.g.
+free_relaxation(t[:, None], T1, T2, M0) with T1, T2, M0 of shape (n_voxels,) returns (n_t, n_voxels, 3).
+"""
+
+import numpy as np
+
+from engine.bloch import free_precession
+
+# Approximate relaxation times at 3 T in ms and proton density relative to CSF: (T1, T2, M0)
+TISSUES = {
+    'white matter': (1084, 69, 0.69),
+    'gray matter': (1820, 99, 0.80),
+    'CSF': (4163, 2000, 1.00),
+    'fat': (382, 68, 0.90),
+}
+
+
+def tissue_parameters(names):
+    """T1, T2 and M0 arrays for a tissue name or a sequence of tissue names of 'TISSUES'."""
+    values = np.array([TISSUES[name] for name in np.atleast_1d(names)], dtype=float)
+    if np.ndim(names) == 0:
+        values = values[0]
+    return values[..., 0], values[..., 1], values[..., 2]
+
+
+def free_relaxation(t, T1, T2, m0=1.0, w0=0.0, flip_angle=np.pi / 2, phase=0.0):
+    """
+    M(t) after an excitation by 'flip_angle' (rad) from thermal equilibrium M0*e_z, precessing with w0 and relaxing
+    with T1 and T2. Times, T1 and T2 only need consistent units.
+    """
+    M = free_precession(t, w0, flip_angle, phase, m0)
+    E1 = np.exp(-np.divide(t, T1))
+    E2 = np.exp(-np.divide(t, T2))
+    mx, my, mz = np.broadcast_arrays(M[..., 0] * E2, M[..., 1] * E2, m0 - (m0 - M[..., 2]) * E1)
+    return np.stack((mx, my, mz), axis=-1)
@@ -0,0 +1,148 @@
+"""
+Receive-coil sensitivity profiles c(r) evaluated on NumPy grids.
+
+A small coil at the origin with its axis along x (surface vector S along -x), far away from a point source at
+r = (x, y, z), has the sensitivity of a magnetic dipole (reciprocity):
+
+    c(r) = -(mu0*S/(4*pi*r^5)) * (3x^2 - r^2, 3xy, 3xz)
+
+so that the flux through the coil is Phi(t) = integral(c(r) . M(r, t) d^3r). The constant mu0*S/(4*pi) is a parameter,
+as the simulations use 1 for simplicity.
+
+Close to the coil the approximation fails. For a circular loop of radius a, c(r) is exactly the field of the loop per
+unit current, given by the complete elliptic integrals K and E (computed here by the arithmetic-geometric mean, so no
+SciPy is needed). 'LoopSensitivityTable' tabulates it once on a (axial, radial) grid, which suffices by the rotational
+symmetry of the loop, and serves any point by bilinear interpolation.
+"""
+
+import numpy as np
+
+
+def dipole_sensitivity(x, y, z, constant=1.0, dtype=float):
+    """
+    c(r) at the coordinates x, y and z (arrays that broadcast against each other, e.g. a whole grid) as an array of
+    shape (..., 3); zero at the origin, where the dipole approximation does not hold.
+    """
+    x, y, z = np.broadcast_arrays(*(np.asarray(c, dtype=dtype) for c in (x, y, z)))
+    r2 = x * x + y * y + z * z
+    r5 = r2 * r2 * np.sqrt(r2)
+    scale = np.divide(-constant, r5, out=np.zeros_like(r5), where=r5 > 0)
+    return np.stack((scale * (3 * x * x - r2), scale * 3 * x * y, scale * 3 * x * z), axis=-1)
+
+
+def elliptic_integrals(m, tolerance=1E-15):
+    """Complete elliptic integrals K(m) and E(m) (parameter m = k^2 < 1, arrays) by the arithmetic-geometric mean."""
+    m = np.asarray(m, dtype=float)
+    a = np.ones_like(m)
+    b = np.sqrt(1 - m)
+    c2_sum = m / 2  # sum of 2^(n-1)*c_n^2, with c_0^2 = m
+    power = 0.5
+    while True:
+        c = (a - b) / 2
+        a, b = (a + b) / 2, np.sqrt(a * b)
+        power *= 2
+        c2_sum = c2_sum + power * c * c
+        if np.all(np.abs(c) <= tolerance * a):
+            break
+    K = np.pi / (2 * a)
+    return K, K * (1 - c2_sum)
+
+
+def loop_sensitivity(x, y, z, radius=1.0, constant=1.0, min_distance=0.0):
+    """
+    Exact c(r) (..., 3) of a circular loop of radius 'radius' in the y-z plane, centered at the origin and with its
+    surface vector along -x, normalized like dipole_sensitivity() (which it approaches far away). Points closer than
+    'min_distance' to the wire are evaluated at that distance from it (e.g. the thickness of the wire).
+    """
+    x, y, z = np.broadcast_arrays(*(np.asarray(c, dtype=float) for c in (x, y, z)))
+    rho = np.sqrt(y * y + z * z)
+
+    # Points inside the wire are moved outwards, away from its center line
+    to_wire = np.hypot(rho - radius, x)
+    if min_distance > 0:
+        push = np.where(to_wire < min_distance, min_distance / np.maximum(to_wire, 1E-12), 1.0)
+        push = np.where(to_wire == 0, 0.0, push)
+        x_wire, rho_wire = x * push, radius + (rho - radius) * push
+        rho_wire = np.where(to_wire == 0, radius + min_distance, rho_wire)
+    else:
+        x_wire, rho_wire = x, rho
+
+    # Field of the loop per unit current, in units of mu0/(2*pi): axial and radial components
+    q = (radius + rho_wire) ** 2 + x_wire ** 2
+    d = (radius - rho_wire) ** 2 + x_wire ** 2
+    K, E = elliptic_integrals(4 * radius * rho_wire / q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        axial = (K + (radius ** 2 - rho_wire ** 2 - x_wire ** 2) / d * E) / np.sqrt(q)
+        radial = np.where(rho_wire > 0, x_wire / (rho_wire * np.sqrt(q))
+                          * (-K + (radius ** 2 + rho_wire ** 2 + x_wire ** 2) / d * E), 0.0)
+
+    # Far away the loop is a dipole of moment pi*a^2: mu0/(2*pi) * 4/(mu0*a^2) = 2/(pi*a^2)
+    scale = -constant * 2 / (np.pi * radius ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radial_y = np.where(rho > 0, radial * y / rho, 0.0)
+        radial_z = np.where(rho > 0, radial * z / rho, 0.0)
+    return scale * np.stack((axial, radial_y, radial_z), axis=-1)
+
+
+class LoopSensitivityTable:
+    """
+    loop_sensitivity() precomputed once on a grid of |x| <= extent[0] and rho <= extent[1] with 'step', and
+    evaluated anywhere by bilinear interpolation: c_x is even in x, the radial component odd. Points outside the
+    table use dipole_sensitivity(), which is accurate that far away. 'min_distance' defaults to 'step', since nodes
+    on the wire itself would be infinite and spoil the interpolation around them.
+    """
+
+    def __init__(self, radius=1.0, constant=1.0, extent=(16, 8), step=1 / 32, min_distance=None):
+        if min_distance is None or min_distance <= 0:
+            min_distance = step
+        self.constant = constant
+        self.step = step
+        axial = np.arange(int(round(extent[0] / step)) + 1) * step
+        rho = np.arange(int(round(extent[1] / step)) + 1) * step
+        c = loop_sensitivity(axial[:, None], rho[None, :], 0, radius, constant, min_distance)
+        self.table = c[..., :2]  # c_x and radial component at y = rho, z = 0
+
+    def __call__(self, x, y, z):
+        x, y, z = np.broadcast_arrays(*(np.asarray(c, dtype=float) for c in (x, y, z)))
+        rho = np.sqrt(y * y + z * z)
+        u, v = np.abs(x) / self.step, rho / self.step
+        inside = (u <= self.table.shape[0] - 1) & (v <= self.table.shape[1] - 1)
+
+        # Bilinear interpolation between the four neighbouring nodes
+        i = np.minimum(np.floor(u), self.table.shape[0] - 2).astype(int)
+        j = np.minimum(np.floor(v), self.table.shape[1] - 2).astype(int)
+        i, j = np.where(inside, i, 0), np.where(inside, j, 0)
+        fu, fv = (np.where(inside, u - i, 0)[..., None], np.where(inside, v - j, 0)[..., None])
+        c = ((1 - fu) * (1 - fv) * self.table[i, j] + fu * (1 - fv) * self.table[i + 1, j]
+             + (1 - fu) * fv * self.table[i, j + 1] + fu * fv * self.table[i + 1, j + 1])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            radial = np.where(rho > 0, np.sign(x) * c[..., 1] / rho, 0.0)
+        interpolated = np.stack((c[..., 0], radial * y, radial * z), axis=-1)
+        return np.where(inside[..., None], interpolated, dipole_sensitivity(x, y, z, self.constant))
+
+
+def circular_array(n_channels, radius, center=(0, 0, 0)):
+    """Centers (n_channels, 3) and axis angles of coils evenly spaced on a circle in the x-y plane, facing outwards."""
+    angles = 2 * np.pi * np.arange(n_channels) / n_channels
+    centers = np.asarray(center, dtype=float) + radius * np.column_stack((np.cos(angles), np.sin(angles),
+                                                                          np.zeros(n_channels)))
+    return centers, angles
+
+
+def coil_array_sensitivities(centers, angles, points, sensitivity=dipole_sensitivity):
+    """
+    c (channels, points, 3) of identical coils at 'centers' (channels, 3) whose axes lie in the x-y plane at 'angles'
+    (rad from the x-axis), at 'points' (points, 3). 'sensitivity'(x, y, z) is the profile (..., 3) of one coil at the
+    origin with its axis along x, e.g. dipole_sensitivity or a LoopSensitivityTable; it is called once for all
+    channels and points.
+    """
+    angles = np.asarray(angles, dtype=float)
+    zeros, ones = np.zeros_like(angles), np.ones_like(angles)
+    # Rows: local x (coil axis), y and z of every channel in global coordinates
+    frames = np.stack((np.stack((np.cos(angles), np.sin(angles), zeros), axis=-1),
+                       np.stack((-np.sin(angles), np.cos(angles), zeros), axis=-1),
+                       np.stack((zeros, zeros, ones), axis=-1)), axis=1)
+    offsets = np.asarray(points, dtype=float).reshape(1, -1, 3) - np.asarray(centers, dtype=float)[:, None, :]
+    local = np.einsum('cij,cpj->cpi', frames, offsets)
+    return np.einsum('cpi,cij->cpj', sensitivity(local[..., 0], local[..., 1], local[..., 2]), frames)
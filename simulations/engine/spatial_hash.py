@@ -0,0 +1,105 @@
+"""
+Uniform-grid spatial hash of points in the plane.
+
+Every point is stored in the bucket of the square cell of side 'cell_size' that contains it, so finding the points
+near a position only looks at the few cells around it instead of at all points: hit-testing, moving and removing a
+point take constant time for any number of points, as long as the cells are not crowded (a cell of about the size of
+the objects works best). Points are identified by hashable keys, e.g. id() of the scene objects they stand for.
+"""
+
+import math
+
+
+class SpatialHash:
+    """Points (x, y) by key, bucketed in square cells of side 'cell_size'."""
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.cells = {}  # (i, j): {key: None} (dicts as ordered sets)
+        self.positions = {}  # key: (x, y), in insertion order
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def cell(self, x, y):
+        """Index (i, j) of the cell containing (x, y)."""
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, key, x, y):
+        """Add the point 'key' at (x, y), or move it there if it is already stored."""
+        if key in self.positions:
+            self.move(key, x, y)
+            return
+        self.positions[key] = (x, y)
+        self.cells.setdefault(self.cell(x, y), {})[key] = None
+
+    def move(self, key, x, y):
+        """Move the point 'key' to (x, y); its bucket only changes when it crosses into another cell."""
+        old_cell, new_cell = self.cell(*self.positions[key]), self.cell(x, y)
+        self.positions[key] = (x, y)
+        if new_cell != old_cell:
+            self._unlink(key, old_cell)
+            self.cells.setdefault(new_cell, {})[key] = None
+
+    def remove(self, key):
+        """Remove the point 'key' (KeyError if it is not stored)."""
+        self._unlink(key, self.cell(*self.positions.pop(key)))
+
+    def clear(self):
+        self.cells.clear()
+        self.positions.clear()
+
+    def _unlink(self, key, cell):
+        bucket = self.cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.cells[cell]  # Only occupied cells are kept
+
+    def near(self, x, y, radius):
+        """Keys of the points within 'radius' of (x, y)."""
+        i_min, j_min = self.cell(x - radius, y - radius)
+        i_max, j_max = self.cell(x + radius, y + radius)
+        found = []
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                for key in self.cells.get((i, j), ()):
+                    px, py = self.positions[key]
+                    if (px - x) ** 2 + (py - y) ** 2 <= radius ** 2:
+                        found.append(key)
+        return found
+
+    def nearest(self, x, y, radius, exclude=None):
+        """Key of the point closest to (x, y) within 'radius' (other than 'exclude'), or None: a hit test."""
+        best, best_distance = None, radius ** 2
+        for key in self.near(x, y, radius):
+            px, py = self.positions[key]
+            distance = (px - x) ** 2 + (py - y) ** 2
+            if key != exclude and distance <= best_distance:
+                best, best_distance = key, distance
+        return best
+
+    def snap(self, x, y, spacing=1.0, exclude=None, max_rings=8, valid=None):
+        """
+        The node of the square lattice of 'spacing' closest to (x, y) that no other point (other than 'exclude')
+        occupies and that 'valid'(x, y) accepts (e.g. bounds or forbidden zones; any node if None), searched ring by
+        ring around the nearest node up to 'max_rings' rings. None if there is no such node.
+        """
+        i0, j0 = round(x / spacing), round(y / spacing)
+        tolerance = spacing / 1000
+        for ring in range(max_rings + 1):
+            nodes = [(i0 + di, j0 + dj) for di in range(-ring, ring + 1) for dj in range(-ring, ring + 1)
+                     if max(abs(di), abs(dj)) == ring]
+            nodes.sort(key=lambda node: (node[0] * spacing - x) ** 2 + (node[1] * spacing - y) ** 2)
+            for i, j in nodes:
+                node_x, node_y = i * spacing, j * spacing
+                if valid is not None and not valid(node_x, node_y):
+                    continue
+                if self.nearest(node_x, node_y, tolerance, exclude) is None:
+                    return node_x, node_y
+        return None
@@ -0,0 +1,14 @@
+import numpy as np
+
+from engine.fourier import fft_coefficients, fft_partial_sum, partial_sum, periodic_grid
+
+
+def test_fft_coefficients_reconstruct_samples_up_to_nyquist():
+    # With all M/2 + 1 coefficients of M samples, the series passes through every sample
+    L = 2.0
+    x = periodic_grid(16, L)
+    samples = np.random.default_rng(0).normal(size=len(x))
+    coefficients = fft_coefficients(samples, len(x) // 2)
+    assert len(coefficients) == len(x) // 2 + 1
+    np.testing.assert_allclose(partial_sum(x, coefficients, L), samples, atol=1E-12)
+    np.testing.assert_allclose(fft_partial_sum(coefficients, len(x), L), samples, atol=1E-12)
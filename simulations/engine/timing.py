@@ -0,0 +1,81 @@
+"""
+Sampling of the simulation time independently of the frame rate of the animations.
+
+The animation loops advance the time t in frames. The physics is sampled several times per frame instead, and all
+samples are evaluated as one vectorized block and plotted as one batch, so smooth graphs do not require a higher frame
+rate. The number of frames to advance comes from the wall clock ('FrameClock'): if rate() could not keep up and frames
+were dropped, the missed frames are caught up in the next block, so t (and the time axis of the graphs) stays in step
+with the real scaled time.
+"""
+
+import time
+
+import numpy as np
+
+
+def subframe_times(t, samples_per_frame, n_frames=1):
+    """
+    Sample times t, t + 1/k, ..., t + n_frames - 1/k (in frames) of the 'n_frames' frames starting at t, with k
+    'samples_per_frame'.
+    """
+    return t + np.arange(n_frames * samples_per_frame) / samples_per_frame
+
+
+class FrameClock:
+    """
+    Counts the frames of an animation requested to run at 'rate' frames per second from time.perf_counter().
+
+    tick() is called once per iteration of the animation loop and returns the number of frames to advance: 1, or more
+    after dropped frames. The elapsed frame periods are accumulated with their fractional part, so the frames advanced
+    add up to the wall clock time even when rate() falls slightly short of the requested rate. An iteration that comes
+    early still advances one frame and leaves the remainder slightly negative (at least -'max_lead'), so the normal
+    jitter of rate() neither skips a frame nor doubles the next one. At most 'max_catch_up' frames are caught up at
+    once; time lost beyond that (e.g. a minimized window) is skipped rather than replayed. Frames only count as dropped
+    when more than 'drop_threshold' frame periods have passed, so jitter is not reported as dropped frames.
+    """
+
+    def __init__(self, rate, max_catch_up=4, smoothing=0.05, drop_threshold=1.5, max_lead=0.5):
+        self.rate = rate
+        self.max_catch_up = max_catch_up
+        self.smoothing = smoothing
+        self.drop_threshold = drop_threshold
+        self.max_lead = max_lead
+        self.achieved_rate = float(rate)
+        self.frames = 0
+        self.dropped = 0
+        self._periods = 0.0
+        self._last = time.perf_counter()
+        self._last_report = self._last
+
+    def tick(self):
+        """Number of frames to advance the simulation by in this iteration."""
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        if elapsed > 0:
+            self.achieved_rate += self.smoothing * (1 / elapsed - self.achieved_rate)
+
+        periods = elapsed * self.rate
+        if periods > self.drop_threshold:
+            self.dropped += int(round(periods)) - 1
+
+        self._periods += periods
+        n_frames = min(max(1, int(self._periods)), self.max_catch_up)
+        self._periods -= n_frames
+        if self._periods >= 1:  # Beyond 'max_catch_up': only the fraction of a frame is kept
+            self._periods -= int(self._periods)
+        self._periods = max(self._periods, -self.max_lead)
+        self.frames += n_frames
+        return n_frames
+
+    def report_due(self, interval=1.0):
+        """Whether 'interval' seconds have passed since report() was last due, to refresh a display sparingly."""
+        now = time.perf_counter()
+        if now - self._last_report < interval:
+            return False
+        self._last_report = now
+        return True
+
+    def report(self):
+        """Achieved versus requested frame rate and the number of frames dropped so far."""
+        return '{:.0f}/{} fps ({} dropped)'.format(self.achieved_rate, self.rate, self.dropped)
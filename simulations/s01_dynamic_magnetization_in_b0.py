@@ -12,6 +12,12 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.bloch import free_precession
+from engine.ensemble import DISTRIBUTIONS, IsochromatEnsemble
+from engine.plotting import BufferedCurve
+from engine.relaxation import TISSUES, free_relaxation, tissue_parameters
+from engine.timing import FrameClock, subframe_times
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -95,6 +101,14 @@ sphere_tip = sphere(pos=arrow_M.axis, radius=arrow_thickness * 0.15, make_trail=
                     retain=300, color=COLOR_TRAIL, opacity=1)
 sphere_tip.trail_radius = sphere_tip.radius
 
+# NET MAGNETIZATION OF THE ENSEMBLE (M_net)
+COLOR_M_NET = vector(0.85, 0.33, 0.1)
+
+arrow_M_net = arrow(pos=vector(0, 0, 0), axis=vector(0, 0, 1), length=Mo, shaftwidth=arrow_thickness, round=True,
+                    color=COLOR_M_NET, visible=False)
+label_M_net = label(pos=vector(-5, 8, arrow_M_net.length * 0.9), height=axis_label_height,
+                    text='<b>M</b><sub>net</sub>', opacity=0, box=False, color=COLOR_M_NET, visible=False)
+
 # FREQUENCY LABELS
 w0 = '0'
 v0 = '0'
@@ -120,6 +134,7 @@ def run_play(b):
 
 # PLAY BUTTON
 button(text="Play", pos=scene.title_anchor, bind=run_play)
+wtext_fps = wtext(pos=scene.title_anchor, text='')  # Achieved vs requested frame rate
 
 # PROGRAM DESCRIPTION
 scene.append_to_caption('  <b>DYNAMIC OF M(t) IN B<sub>0</sub></b>: \n')
@@ -211,6 +226,58 @@ scene.append_to_caption('    X-Y view activation:      ')
 button_x_y = button(text='X-Y View', bind=change_view)
 x_y_view = False
 
+# RELAXATION FUNCTIONS
+relaxation = False
+tissue = 'white matter'
+
+
+def set_relaxation(c):
+    global relaxation
+    relaxation = c.checked
+    if relaxation:
+        gp.xtitle = 'Time (ms)'
+    else:
+        gp.xtitle = 'Time (ns)'
+    reset_animation()
+
+
+def set_tissue(m):
+    global tissue
+    tissue = m.selected
+    reset_animation()
+
+
+# RELAXATION CHECKBOX AND TISSUE MENU
+scene.append_to_caption('\n\n    T<sub>1</sub>/T<sub>2</sub> relaxation:      ')
+checkbox_relaxation = checkbox(text='Relaxation', bind=set_relaxation, checked=False)
+scene.append_to_caption('      ')
+menu_tissue = menu(choices=list(TISSUES), selected=tissue, bind=set_tissue)
+
+# ENSEMBLE FUNCTIONS
+ensemble_mode = False
+ensemble = IsochromatEnsemble.from_distribution('lorentzian')
+
+
+def set_ensemble(c):
+    global ensemble_mode
+    ensemble_mode = c.checked
+    arrow_M_net.visible = ensemble_mode
+    label_M_net.visible = ensemble_mode
+    reset_animation()
+
+
+def set_distribution(m):
+    global ensemble
+    ensemble = IsochromatEnsemble.from_distribution(m.selected)
+    reset_animation()
+
+
+# ENSEMBLE CHECKBOX AND DISTRIBUTION MENU
+scene.append_to_caption('\n\n    T<sub>2</sub>* dephasing of an ensemble:      ')
+checkbox_ensemble = checkbox(text='Ensemble', bind=set_ensemble, checked=False)
+scene.append_to_caption('      ')
+menu_distribution = menu(choices=list(DISTRIBUTIONS), selected='lorentzian', bind=set_distribution)
+
 # SCALE FACTOR DESCRIPTION
 scene.append_to_caption('\n')
 scene.append_to_caption('''      
@@ -221,14 +288,23 @@ scene.append_to_caption('''
     1 s of the simulation, approximately 127,728,049
     rotations are completed in real life within the
     same 1 second duration (B<sub>0</sub> = 3 T).\n
+    With relaxation activated, the decay of <b>M</b> is 
+    shown with 1 s of the simulation corresponding to 
+    30 milliseconds (ms) of T<sub>1</sub>/T<sub>2</sub> relaxation 
+    (values of the tissues at 3 T).\n
+    With the ensemble activated, 10<sup>7</sup> spins with a 
+    Lorentzian or Gaussian distribution of \u03C9<sub>0</sub> (exaggerated 
+    B<sub>0</sub> inhomogeneity of 5 %) dephase and the net 
+    magnetization <b>M</b><sub>net</sub> decays (FID).\n
     by Victoria Rincon and Frederik Laun\n''')
 
 # GRAPH
-graph(width=scene.width, height=scene.width / 4, fast=False, title='<b>Evolution of M(t) in B<sub>0</sub></b>',
-      xtitle='Time (ns)', ytitle='M(t)/M<sub>0</sub>', ymin=-1, ymax=1, scroll=True, xmin=0, xmax=300)
-Mx = gcurve(color=color.blue, label='<i>M</i><sub>x</sub>')
-My = gcurve(color=color.red, label='<i>M</i><sub>y</sub>')
-Mz = gcurve(color=color.green, label='<i>M</i><sub>z</sub>')
+gp = graph(width=scene.width, height=scene.width / 4, fast=False, title='<b>Evolution of M(t) in B<sub>0</sub></b>',
+           xtitle='Time (ns)', ytitle='M(t)/M<sub>0</sub>', ymin=-1, ymax=1, scroll=True, xmin=0, xmax=300)
+Mx = BufferedCurve(gcurve(color=color.blue, label='<i>M</i><sub>x</sub>'))
+My = BufferedCurve(gcurve(color=color.red, label='<i>M</i><sub>y</sub>'))
+Mz = BufferedCurve(gcurve(color=color.green, label='<i>M</i><sub>z</sub>'))
+Mxy_net = BufferedCurve(gcurve(color=COLOR_M_NET, label='|<i>M</i><sub>xy,net</sub>|'))
 
 
 # RESET FUNCTION
@@ -239,14 +315,18 @@ def reset_animation():
     Mx.delete()
     My.delete()
     Mz.delete()
+    Mxy_net.delete()
     sphere_tip.clear_trail()
 
 
 # ANIMATION PARAMETERS
 RATEVALUE = 30  # Frames per second
+SAMPLES_PER_FRAME = 64  # Physics samples per frame (about 2 kHz)
 
 SCALE_FACTOR = 3831841466
 TIME_FACTOR = 7.829
+RELAXATION_TIME_FACTOR = 30  # units ms of relaxation per second of the simulation
+ENSEMBLE_WIDTH = 0.05  # Width of the distribution of w0 relative to w0
 FORMAT_FACTOR = 1E6
 
 # PHYSICS CONSTANTS
@@ -256,10 +336,16 @@ GAMMA_PROTONS = 2.67513E8
 t = 0
 t_g = 0
 
+# Frames due per iteration by the wall clock
+clock = FrameClock(RATEVALUE)
+
 # ITERATION OVER TIME
 while True:
 
     rate(RATEVALUE)  # Limit the animation to run at a maximum of 'rate_value' frames per second
+    n_frames = clock.tick()  # Frames due by the wall clock, including dropped ones
+    if play and clock.report_due():  # About once a second, not every frame
+        wtext_fps.text = '   ' + clock.report()
     if play:
         # Frequencies calculation
         B0 = slider_B0.value
@@ -273,9 +359,31 @@ while True:
         w0_formatted = "{:.1f}".format(w0)
 
         # Setting the behaviour of the Magnetization (M)
-        arrow_M.axis = Mo * vector(cos(w0_simulation * t) * sin(radians(angle_M)),
-                                   sin(w0_simulation * t) * sin(radians(angle_M)),
-                                   cos(radians(angle_M)))  # Change the axis of the arrow over time
+        # All samples of this frame are evaluated in one call: (samples, spins, 3)
+        t_samples = subframe_times(t, SAMPLES_PER_FRAME, n_frames)
+
+        # The on-resonant spin first, followed by the frequency bins of the ensemble
+        w0_spins = np.array([w0_simulation])
+        if ensemble_mode:
+            w0_spins = w0_simulation * np.concatenate(([1], 1 + ENSEMBLE_WIDTH * ensemble.offsets))
+
+        if relaxation:
+            # Relaxation times in frames of the simulation
+            T1, T2, M0 = tissue_parameters(tissue)
+            T1_simulation = T1 * RATEVALUE / RELAXATION_TIME_FACTOR
+            T2_simulation = T2 * RATEVALUE / RELAXATION_TIME_FACTOR
+            M_spins = free_relaxation(t_samples[:, None], T1_simulation, T2_simulation, M0, w0_spins,
+                                      radians(angle_M))
+        else:
+            M_spins = free_precession(t_samples[:, None], w0_spins, radians(angle_M))
+
+        M_samples = M_spins[:, 0]
+        M = M_samples[0]
+        if ensemble_mode:
+            M_net_samples = ensemble.net_magnetization(M_spins[:, 1:])
+            arrow_M_net.axis = Mo * vector(*M_net_samples[0])
+            label_M_net.pos = vector(arrow_M_net.axis.x + 5, arrow_M_net.axis.y - 5, arrow_M_net.axis.z + 3)
+        arrow_M.axis = Mo * vector(*M)  # Change the axis of the arrow over time
         label_M.pos = vector(arrow_M.axis.x + 5, arrow_M.axis.y + 5, arrow_M.axis.z + 3)
 
         # Adjusting B0 vector length according to the selected strength
@@ -292,15 +400,21 @@ while True:
         # Adjusting trail trajectory
         sphere_tip.pos = arrow_M.axis
 
-        # Displaying the components of the magnetization
-        Mx.plot(t_g, cos(w0_simulation * t) * sin(radians(angle_M)))
-        My.plot(t_g, sin(w0_simulation * t) * sin(radians(angle_M)))
-        Mz.plot(t_g, cos(radians(angle_M)))
-
         # Time scaling for the graph
-        t_g = t * TIME_FACTOR / RATEVALUE
+        if relaxation:
+            t_g_samples = t_samples * RELAXATION_TIME_FACTOR / RATEVALUE
+        else:
+            t_g_samples = t_samples * TIME_FACTOR / RATEVALUE
+        t_g = t_g_samples[0]
+
+        # Displaying the components of the magnetization (one batch per frame)
+        Mx.plot(t_g_samples, M_samples[:, 0])
+        My.plot(t_g_samples, M_samples[:, 1])
+        Mz.plot(t_g_samples, M_samples[:, 2])
+        if ensemble_mode:
+            Mxy_net.plot(t_g_samples, np.hypot(M_net_samples[:, 0], M_net_samples[:, 1]))
 
         # time iteration
-        t = t + 1
+        t = t + n_frames
 
 
@@ -12,6 +12,9 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.bloch import rrf_to_wcs
+from engine.timing import FrameClock
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -139,6 +142,7 @@ def run_play(b):
 
 # PLAY BUTTON
 button(text="Play", pos=scene.title_anchor, bind=run_play)
+wtext_fps = wtext(pos=scene.title_anchor, text='')  # Achieved vs requested frame rate
 
 # PROGRAM DESCRIPTION
 scene.append_to_caption('  <b>THE ROTATING REFERENCE FRAME (RRF)</b>: \n')
@@ -180,11 +184,11 @@ phase_path_radious = 1
 
 def set_curve_parameters(phase_path_angle):
     phase_path_radious = arrow_B1plus.length * 0.4
-    global phase_path_points
-    phase_path_points = []
-    for angle in range(0, phase_path_angle + 1):
-        phase_path_points.append(
-            vector(phase_path_radious * cos(radians(angle)), phase_path_radious * sin(radians(angle)), 0))
+    global phase_path_points, phase_path_array
+    angles = np.radians(np.arange(0, phase_path_angle + 1))
+    phase_path_array = np.stack((phase_path_radious * np.cos(angles), phase_path_radious * np.sin(angles),
+                                 np.zeros_like(angles)), axis=-1)
+    phase_path_points = [vector(*point) for point in phase_path_array]
     curve_path.append(phase_path_points)
 
 
@@ -269,13 +273,19 @@ GAMMA_PROTONS = 2.67513E8
 
 # VARIABLES INITIALIZATION
 phase_path_points = []
-phase_path_points_rotating = []
+phase_path_array = np.zeros((0, 3))
 t = 0
 
+# Frames due per iteration by the wall clock
+clock = FrameClock(RATEVALUE)
+
 # ITERATION OVER TIME
 while True:
 
     rate(RATEVALUE)
+    n_frames = clock.tick()  # Frames due by the wall clock, including dropped ones
+    if play and clock.report_due():  # About once a second, not every frame
+        wtext_fps.text = '   ' + clock.report()
     if play:
 
         # Frequencies calculation
@@ -304,13 +314,13 @@ while True:
         label_omega.text = '\u03A9 = ' + omega_formatted + ' rad/s'
 
         # Setting the behaviour of the RRF
-        x_rrf.axis = vector(axis_length * cos(omega_simulation * t), axis_length * sin(omega_simulation * t),
-                            0)  # Change the axis of the arrow over time
-        x_neg_rrf.axis = vector(-axis_length * cos(omega_simulation * t), -axis_length * sin(omega_simulation * t), 0)
+        e_x_rrf, e_y_rrf = rrf_to_wcs(np.eye(3)[:2], omega_simulation * t)
+        x_rrf.axis = axis_length * vector(*e_x_rrf)  # Change the axis of the arrow over time
+        x_neg_rrf.axis = -axis_length * vector(*e_x_rrf)
         label_x_rrf.pos = vector(x_rrf.axis.x + 5, x_rrf.axis.y + 5, x_rrf.axis.z + 3)
 
-        y_rrf.axis = vector(-axis_length * sin(omega_simulation * t), axis_length * cos(omega_simulation * t), 0)
-        y_neg_rrf.axis = vector(axis_length * sin(omega_simulation * t), -axis_length * cos(omega_simulation * t), 0)
+        y_rrf.axis = axis_length * vector(*e_y_rrf)
+        y_neg_rrf.axis = -axis_length * vector(*e_y_rrf)
         label_y_rrf.pos = vector(y_rrf.axis.x + 5, y_rrf.axis.y + 5, y_rrf.axis.z + 3)
 
         # Adjusting Bo vector length according to the selected strength
@@ -318,16 +328,14 @@ while True:
         label_B0.pos = vector(-5, 8, arrow_B0.length * 0.9)
 
         # Setting the behaviour of the B1+ field
-        arrow_B1plus.axis = arrow_B1plus.length * vector(
-            cos(radians(B1phase)) * cos(wHF_simulation * t) - sin(radians(B1phase)) * sin(wHF_simulation * t),
-            sin(radians(B1phase)) * cos(wHF_simulation * t) + cos(radians(B1phase)) * sin(wHF_simulation * t), 0)
+        B1plus = rrf_to_wcs((cos(radians(B1phase)), sin(radians(B1phase)), 0), wHF_simulation * t)
+        arrow_B1plus.axis = arrow_B1plus.length * vector(*B1plus)
         label_B1plus.pos = vector(arrow_B1plus.axis.x + 5, arrow_B1plus.axis.y + 5, arrow_B1plus.axis.z + 3)
 
         # Setting the curve that represent the phase of the B1+ field
+        rotated_phase_path = rrf_to_wcs(phase_path_array, wHF_simulation * t)
         for N in range(0, len(phase_path_points)):
-            curve_path.modify(N, pos=vector(
-                phase_path_points[N].x * cos(wHF_simulation * t) - phase_path_points[N].y * sin(wHF_simulation * t),
-                phase_path_points[N].x * sin(wHF_simulation * t) + phase_path_points[N].y * cos(wHF_simulation * t), 0))
+            curve_path.modify(N, pos=vector(*rotated_phase_path[N]))
 
         if curve_path.npoints != 0:
             label_curve_path.visible = True
@@ -336,5 +344,5 @@ while True:
             label_curve_path.pos = data_label_curve_path_position["pos"] * 1.4
 
         # time iteration
-        t = t + 1
+        t = t + n_frames
 
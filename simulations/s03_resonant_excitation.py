@@ -12,6 +12,11 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.bloch import rrf_to_wcs
+from engine.plotting import BufferedCurve
+from engine.rotation import RotationPropagator
+from engine.timing import FrameClock, subframe_times
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -150,6 +155,7 @@ def run_play(b):
 
 # PLAY BUTTON
 button(text="Play", pos=scene.title_anchor, bind=run_play)
+wtext_fps = wtext(pos=scene.title_anchor, text='')  # Achieved vs requested frame rate
 
 # PROGRAM DESCRIPTION
 scene.append_to_caption('  <b> RESONANT EXCITATION</b>\n')
@@ -202,8 +208,6 @@ def change_to_FFR():
 scene.append_to_caption('    World Coordinate System:      ')
 button_WCS = button(text='WCS', bind=change_to_WSC, background=color.green)
 
-scene.append_to_caption('<p style="color:red">      In the WCS, <b>M</b> has a minor error in its behavior.</p>')
-
 scene.append_to_caption('\n    Rotating Reference Frame:      ')
 button_RRF = button(text='RRF', bind=change_to_FFR)
 
@@ -361,15 +365,17 @@ scene.append_to_caption('''
 # GRAPH
 gp = graph(width=scene.width, height=scene.width / 4, title='<b>Evolution of M(t) in B(t)</b>', xtitle='Time (ns)',
            ytitle='M(t)/M<sub>0</sub>', ymin=-1, ymax=1, scroll=True, xmin=0, xmax=300, fast=False)
-Mx = gcurve(color=color.blue, label='<i>M</i><sub>x</sub>')
-My = gcurve(color=color.red, label='<i>M</i><sub>y</sub>')
-Mz = gcurve(color=color.green, label='<i>M</i><sub>z</sub>')
+Mx = BufferedCurve(gcurve(color=color.blue, label='<i>M</i><sub>x</sub>'))
+My = BufferedCurve(gcurve(color=color.red, label='<i>M</i><sub>y</sub>'))
+Mz = BufferedCurve(gcurve(color=color.green, label='<i>M</i><sub>z</sub>'))
 
 
 # RESET FUNCTION
 def reset_animation():
-    global t
+    global t, M_rrf, propagator
     t = 0
+    M_rrf = np.array([0.0, 0.0, 1.0])
+    propagator = None  # Rebuilt with the current parameters in the next frame
     Mx.delete()
     My.delete()
     Mz.delete()
@@ -378,6 +384,7 @@ def reset_animation():
 
 # ANIMATION PARAMETERS
 RATEVALUE = 100  # Frames per second
+SAMPLES_PER_FRAME = 20  # Physics samples per frame (2 kHz)
 
 SCALE_FACTOR_w0 = 3831841466  # 3.8E9
 SCALE_FACTOR_w1 = 159660.0611
@@ -397,10 +404,20 @@ phase_path_points_rotating = []
 t = 0
 t_g = 0
 
+# Magnetization in the RRF, propagated exactly by rotations about Beff
+M_rrf = np.array([0.0, 0.0, 1.0])
+propagator = None
+
+# Frames due per iteration by the wall clock
+clock = FrameClock(RATEVALUE)
+
 # ITERATION OVER TIME
 while True:
 
     rate(RATEVALUE)
+    n_frames = clock.tick()  # Frames due by the wall clock, including dropped ones
+    if play and clock.report_due():  # About once a second, not every frame
+        wtext_fps.text = '   ' + clock.report()
     if play:
 
         B0 = B0_bs
@@ -418,6 +435,15 @@ while True:
         # Resonance Case (Resonance condition)
         wHF_simulation = w0_simulation
 
+        # Rotation operator of one sample step about B1+ (Beff = B1+ on resonance)
+        if propagator is None:
+            propagator = RotationPropagator(w1_simulation, b1_phase=radians(slider_B1phase.value),
+                                            dt=1 / SAMPLES_PER_FRAME)
+
+        # All samples of this frame in one call
+        t_samples = subframe_times(t, SAMPLES_PER_FRAME, n_frames)
+        M_rrf_samples, M_rrf_next = propagator.sample(M_rrf, n_frames * SAMPLES_PER_FRAME)
+
         # Formatting the variables to display on the screen
         v0_formatted = "{:.3f}".format(v0 / FORMAT_FACTOR)
         w0_formatted = "{:.1f}".format(w0 / FORMAT_FACTOR)
@@ -450,18 +476,18 @@ while True:
             label_z_rff.visible = False
 
             # Setting the behaviour of the Magnetization (M) in the WCS
-            # THIS BEHAVIOUR HAS TO BE MODIFIED <-------------------------------------------------------------------------------------
-            arrow_M.axis = vector(Mo * sin(w0_simulation * t + radians(slider_B1phase.value)) * sin(w1_simulation * t),
-                                  -Mo * cos(w0_simulation * t + radians(slider_B1phase.value)) * sin(w1_simulation * t),
-                                  Mo * cos(w1_simulation * t))
-            # arrow_M.axis = vector(-Mo*sin(w0_simulation*t+radians(slider_B1phase.value))*sin(w1_simulation*t), Mo*cos(w0_simulation*t-radians(slider_B1phase.value))*sin(w1_simulation*t), Mo*cos(w1_simulation*t))
+            M_samples = rrf_to_wcs(M_rrf_samples, wHF_simulation * t_samples)
+            M = M_samples[0]
+            arrow_M.axis = Mo * vector(*M)
 
             # Setting the behaviour of the B1+ field in the WCS
-            arrow_B1plus.axis = vector(arrow_B1plus.length * cos(wHF_simulation * t),
-                                       arrow_B1plus.length * sin(wHF_simulation * t), 0)
+            B1plus = rrf_to_wcs((cos(radians(slider_B1phase.value)), sin(radians(slider_B1phase.value)), 0),
+                                wHF_simulation * t)
+            arrow_B1plus.axis = arrow_B1plus.length * vector(*B1plus)
 
             # Time scaling for the graph
-            t_g = t * TIME_FACTOR_WCS / RATEVALUE
+            t_g_samples = t_samples * TIME_FACTOR_WCS / RATEVALUE
+            t_g = t_g_samples[0]
 
 
         # In the Rotating Raference Frame (RRF)
@@ -488,16 +514,17 @@ while True:
             label_z_rff.visible = True
 
             # Setting the behaviour of the Magnetization (M) in the RRF
-            arrow_M.axis = vector(Mo * sin(w1_simulation * t) * sin(radians(slider_B1phase.value)),
-                                  -Mo * sin(w1_simulation * t) * cos(radians(slider_B1phase.value)),
-                                  Mo * cos(w1_simulation * t))
+            M_samples = M_rrf_samples
+            M = M_samples[0]
+            arrow_M.axis = Mo * vector(*M)
 
             # Setting the behaviour of the B1+ field in the RRF
             arrow_B1plus.axis = vector(arrow_B1plus.length * cos(radians(slider_B1phase.value)),
                                        arrow_B1plus.length * sin(radians(slider_B1phase.value)), 0)
 
             # Time scaling for the graph
-            t_g = t * TIME_FACTOR_RRF / RATEVALUE
+            t_g_samples = t_samples * TIME_FACTOR_RRF / RATEVALUE
+            t_g = t_g_samples[0]
 
             # Curve
             if curve_path.npoints != 0:
@@ -519,10 +546,11 @@ while True:
         sphere_tip.pos = arrow_M.axis
 
         # Displaying the components of the magnetization
-        Mx.plot(t_g, arrow_M.axis.x / Mo)
-        My.plot(t_g, arrow_M.axis.y / Mo)
-        Mz.plot(t_g, arrow_M.axis.z / Mo)
+        Mx.plot(t_g_samples, M_samples[:, 0])
+        My.plot(t_g_samples, M_samples[:, 1])
+        Mz.plot(t_g_samples, M_samples[:, 2])
 
         # time iteration
-        t = t + 1
+        t = t + n_frames
+        M_rrf = M_rrf_next
 
@@ -12,6 +12,12 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.bloch import rrf_to_wcs
+from engine.ensemble import DISTRIBUTIONS, IsochromatEnsemble
+from engine.plotting import BufferedCurve
+from engine.rotation import RotationPropagator
+from engine.timing import FrameClock, subframe_times
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -139,6 +145,7 @@ def run_play(b):
 
 # PLAY BUTTON
 button(text="Play", pos=scene.title_anchor, bind=run_play)
+wtext_fps = wtext(pos=scene.title_anchor, text='')  # Achieved vs requested frame rate
 
 # PROGRAM DESCRIPTION
 scene.append_to_caption('  <b> OFF-RESONANT EXCITATION</b>\n')
@@ -255,6 +262,14 @@ sphere_tip = sphere(pos=arrow_M.axis, radius=arrow_thickness * 0.15, make_trail=
                     retain=320, color=COLOR_TRAIL, opacity=1)
 sphere_tip.trail_radius = sphere_tip.radius
 
+# NET MAGNETIZATION OF THE ENSEMBLE (M_net)
+COLOR_M_NET = vector(0.85, 0.33, 0.1)
+
+arrow_M_net = arrow(pos=vector(0, 0, 0), axis=vector(0, 0, 1), length=Mo, shaftwidth=arrow_thickness,
+                    headwidth=axis_headwidth, headlength=axis_headlength, round=True, color=COLOR_M_NET, visible=False)
+label_M_net = label(pos=vector(-5, 8, arrow_M_net.length * 0.9), height=axis_label_height,
+                    text='<b>M</b><sub>net</sub>', opacity=0, box=False, color=COLOR_M_NET, visible=False)
+
 # COORDINATE SYSTEM SELECTION FUNCTIONS
 WCS_view = True
 
@@ -299,8 +314,6 @@ def change_to_FFR():
 scene.append_to_caption('    World Coordinate System:      ')
 button_WCS = button(text='WCS', bind=change_to_WSC, background=color.green)
 
-scene.append_to_caption('<p style="color:red">      In the WCS, <b>M</b> has a minor error in its behavior.</p>')
-
 scene.append_to_caption('\n    Rotating Reference Frame:      ')
 button_RRF = button(text='RRF', bind=change_to_FFR)
 
@@ -352,6 +365,33 @@ scene.append_to_caption('      ')
 radio_offresonance_10 = radio(ppm=10, bind=set_off_resonance, checked=True, name='off_resonance')
 scene.append_to_caption('10 ppm\n\n')
 
+# ENSEMBLE FUNCTIONS
+ensemble_mode = False
+ensemble = IsochromatEnsemble.from_distribution('lorentzian')
+
+
+def set_ensemble(c):
+    global ensemble_mode
+    ensemble_mode = c.checked
+    arrow_M_net.visible = ensemble_mode
+    label_M_net.visible = ensemble_mode
+    reset_animation()
+
+
+def set_distribution(m):
+    global ensemble
+    ensemble = IsochromatEnsemble.from_distribution(m.selected)
+    reset_animation()
+
+
+# ENSEMBLE CHECKBOX AND DISTRIBUTION MENU
+scene.append_to_caption('    B<sub>0</sub> inhomogeneity (1 ppm):\n')
+scene.append_to_caption('      ')
+checkbox_ensemble = checkbox(text='Ensemble', bind=set_ensemble, checked=False)
+scene.append_to_caption('      ')
+menu_distribution = menu(choices=list(DISTRIBUTIONS), selected='lorentzian', bind=set_distribution)
+scene.append_to_caption('\n\n')
+
 # ANGLE LABEL
 theta = '0'
 label_theta = label(pos=vector(20, 20, 0), pixel_pos=True, height=axis_label_height * 0.75, line=False, box=False,
@@ -388,23 +428,30 @@ x_y_view = False
 # GRAPH
 gp = graph(width=scene.width, height=scene.width / 4, title='<b>Evolution of M(t) in B(t)</b>', xtitle='Time (ns)',
            ytitle='M(t)/M<sub>0</sub>', ymin=-1, ymax=1, scroll=True, xmin=0, xmax=300, fast=False)
-Mx = gcurve(color=color.blue, label='<i>M</i><sub>x</sub>')
-My = gcurve(color=color.red, label='<i>M</i><sub>y</sub>')
-Mz = gcurve(color=color.green, label='<i>M</i><sub>z</sub>')
+Mx = BufferedCurve(gcurve(color=color.blue, label='<i>M</i><sub>x</sub>'))
+My = BufferedCurve(gcurve(color=color.red, label='<i>M</i><sub>y</sub>'))
+Mz = BufferedCurve(gcurve(color=color.green, label='<i>M</i><sub>z</sub>'))
+Mxy_net = BufferedCurve(gcurve(color=COLOR_M_NET, label='|<i>M</i><sub>xy,net</sub>|'))
 
 
 # RESET FUNCTION
 def reset_animation():
-    global t
+    global t, M_rrf, propagator, M_bins, propagator_ensemble
     t = 0
+    M_rrf = np.array([0.0, 0.0, 1.0])
+    propagator = None  # Rebuilt with the current parameters in the next frame
+    M_bins = None
+    propagator_ensemble = None
     Mx.delete()
     My.delete()
     Mz.delete()
+    Mxy_net.delete()
     sphere_tip.clear_trail()
 
 
 # ANIMATION PARAMETERS
 RATEVALUE = 100  # Frames per second
+SAMPLES_PER_FRAME = 20  # Physics samples per frame (2 kHz)
 
 SCALE_FACTOR_w0 = 3.8E9
 SCALE_FACTOR_w1 = 159660.6579
@@ -414,16 +461,32 @@ TIME_FACTOR_RRF = 0.6263  # units ms  <---------
 
 FORMAT_FACTOR = 1000000
 
+ENSEMBLE_WIDTH = 1E-6  # Width of the distribution of w0 (ppm)
+
 # VARIABLES INITIALIZATION
 arrow_Zc_Beff_max_length = arrow_Zc_Beff.length
 
 t = 0
 t_g = 0
 
+# Magnetization in the RRF, propagated exactly by rotations about Beff
+M_rrf = np.array([0.0, 0.0, 1.0])
+propagator = None
+
+# Magnetization of the frequency bins of the ensemble in the RRF
+M_bins = None
+propagator_ensemble = None
+
+# Frames due per iteration by the wall clock
+clock = FrameClock(RATEVALUE)
+
 # ITERATION OVER TIME
 while True:
 
     rate(RATEVALUE)
+    n_frames = clock.tick()  # Frames due by the wall clock, including dropped ones
+    if play and clock.report_due():  # About once a second, not every frame
+        wtext_fps.text = '   ' + clock.report()
     if play:
 
         # Frequencies calculation
@@ -435,7 +498,7 @@ while True:
 
         off_resonance = off_resonance_bs
         wHF = (1 + off_resonance) * w0
-        wHF_simulation = off_resonance * w0_simulation
+        wHF_simulation = (1 + off_resonance) * w0_simulation
 
         B1 = B1_bs
         w1 = GAMMA_PROTONS * B1
@@ -443,8 +506,29 @@ while True:
         w1_simulation = (w1 / SCALE_FACTOR_w1)
         v1_simulation = w1_simulation / (2 * pi)
 
+        # Signed off-resonance: Beff points below the x-y plane of the RRF when w_HF is above w0
         delta_wHF = w0 - wHF
         weff = sqrt(pow(abs(delta_wHF), 2) + pow(w1, 2))
+        delta_wHF_simulation = delta_wHF / SCALE_FACTOR_w1
+
+        # Rotation operator of one sample step about Beff
+        if propagator is None:
+            propagator = RotationPropagator(w1_simulation, delta_wHF_simulation, dt=1 / SAMPLES_PER_FRAME)
+
+        # One rotation operator per frequency bin of the ensemble
+        if ensemble_mode and propagator_ensemble is None:
+            width_simulation = ENSEMBLE_WIDTH * w0 / SCALE_FACTOR_w1
+            propagator_ensemble = RotationPropagator(w1_simulation,
+                                                     delta_wHF_simulation + width_simulation * ensemble.offsets,
+                                                     dt=1 / SAMPLES_PER_FRAME)
+            M_bins = np.tile(M_rrf, (len(ensemble.offsets), 1))
+
+        # All samples of this frame in one call
+        t_samples = subframe_times(t, SAMPLES_PER_FRAME, n_frames)
+        M_rrf_samples, M_rrf_next = propagator.sample(M_rrf, n_frames * SAMPLES_PER_FRAME)
+        if ensemble_mode:
+            M_bins_samples, M_bins_next = propagator_ensemble.sample(M_bins, n_frames * SAMPLES_PER_FRAME)
+            M_net_rrf_samples = ensemble.net_magnetization(M_bins_samples)
 
         # Formatting the variables to display on the screen
         v0_formatted = "{:.3f}".format(v0 / FORMAT_FACTOR)
@@ -458,8 +542,8 @@ while True:
         strength_Zc_Beff = abs(delta_wHF) / GAMMA_PROTONS
         arrow_Zc_Beff.length = round((strength_Zc_Beff / B1_bs) * arrow_B1plus.length, 2)
 
-        # Adjusting Theta
-        theta = acos(abs(delta_wHF) / weff)
+        # Adjusting Theta (angle between Beff and z, above 90° for a negative delta_wHF)
+        theta = acos(delta_wHF / weff)
         theta_degrees = "{:.2f}".format(degrees(theta))
         label_theta.text = '\u03B8 = ' + theta_degrees + '°'
 
@@ -489,10 +573,12 @@ while True:
             z_rff.visible = False
             label_z_rff.visible = False
 
-            # Setting the behaviour of the Magnetization (M) in the WCS
-            # THIS BEHAVIOUR HAS TO BE MODIFIED <-------------------------------------------------------------------------------------
-            arrow_M.axis = vector(-Mo * sin(w0_simulation * t) * sin(w1_simulation * t),
-                                  Mo * cos(w0_simulation * t) * sin(w1_simulation * t), Mo * cos(w1_simulation * t))
+            # Setting the behaviour of the Magnetization (M) in the WCS (the RRF rotates with w_HF)
+            M_samples = rrf_to_wcs(M_rrf_samples, wHF_simulation * t_samples)
+            M = M_samples[0]
+            arrow_M.axis = Mo * vector(*M)
+            if ensemble_mode:
+                M_net_samples = rrf_to_wcs(M_net_rrf_samples, wHF_simulation * t_samples)
 
             # Setting the behaviour of the B1+ field in the WCS
             arrow_B1plus.axis = vector(arrow_B1plus.length * cos(wHF_simulation * t),
@@ -501,7 +587,8 @@ while True:
             label_B1plus.pos = vector(arrow_B1plus.axis.x + 5, arrow_B1plus.axis.y + 5, arrow_B1plus.axis.z + 6)
 
             # Time scaling for the graph
-            t_g = t * TIME_FACTOR_WCS / RATEVALUE
+            t_g_samples = t_samples * TIME_FACTOR_WCS / RATEVALUE
+            t_g = t_g_samples[0]
 
 
         # In the Rotating Raference Frame (RRF)
@@ -538,23 +625,29 @@ while True:
             arrow_Beff.axis = vector(arrow_B1plus.axis.x, 0, arrow_B1plus.length / tan(theta))
             label_Beff.pos = vector(arrow_Beff.axis.x + 8, arrow_Beff.axis.y + 5, arrow_Beff.axis.z + 8)
 
-            arrow_Zc_Beff.axis = vector(0, 0, arrow_Zc_Beff.length)
-            label_Zc_Beff.pos = vector(-10, 30, arrow_Zc_Beff.length * 0.9)
+            Zc_Beff_sign = 1 if delta_wHF >= 0 else -1
+            arrow_Zc_Beff.axis = vector(0, 0, Zc_Beff_sign * arrow_Zc_Beff.length)
+            label_Zc_Beff.pos = vector(-10, 30, Zc_Beff_sign * arrow_Zc_Beff.length * 0.9)
 
-            MX = cos(w0_simulation * t) * sin(theta)
-            MY = sin(w0_simulation * t) * sin(theta)
-            MZ = cos(theta)
+            # Setting the behaviour of the Magnetization (M) in the RRF: precession about Beff
+            M_samples = M_rrf_samples
+            M = M_samples[0]
 
             Mo = arrow_Beff.length * 0.7
-            arrow_M.axis = Mo * vector(MX * cos(theta) + MZ * sin(theta), sin(w0_simulation * t) * sin(theta),
-                                       -MX * sin(theta) + MZ * cos(theta))
+            arrow_M.axis = Mo * vector(*M)
+            if ensemble_mode:
+                M_net_samples = M_net_rrf_samples
 
             # Time scaling for the graph
-            t_g = t * TIME_FACTOR_RRF / RATEVALUE
+            t_g_samples = t_samples * TIME_FACTOR_RRF / RATEVALUE
+            t_g = t_g_samples[0]
 
         # Adjusting labels position
         label_B0.pos = vector(-5, 8, arrow_B0.length * 0.9)
         label_M.pos = vector(arrow_M.axis.x + 5, arrow_M.axis.y + 5, arrow_M.axis.z + 3)
+        if ensemble_mode:
+            arrow_M_net.axis = Mo * vector(*M_net_samples[0])
+            label_M_net.pos = vector(arrow_M_net.axis.x + 5, arrow_M_net.axis.y - 5, arrow_M_net.axis.z + 3)
 
         # Verification print statements
         # print('v0: ',v0,'     v0_sim: ',v0_simulation,'\nw0: ',w0,'     w0_sim: ',w0_simulation, '\nv1: ',v1,'     v1_sim: ',v1_simulation,'\nw1: ',w1,'     w1_sim: ',w1_simulation, '\B1: ', B1)
@@ -564,10 +657,15 @@ while True:
         sphere_tip.pos = arrow_M.axis
 
         # Displaying the components of the magnetization
-        Mx.plot(t_g, arrow_M.axis.x / Mo)
-        My.plot(t_g, arrow_M.axis.y / Mo)
-        Mz.plot(t_g, arrow_M.axis.z / Mo)
+        Mx.plot(t_g_samples, M_samples[:, 0])
+        My.plot(t_g_samples, M_samples[:, 1])
+        Mz.plot(t_g_samples, M_samples[:, 2])
+        if ensemble_mode:
+            Mxy_net.plot(t_g_samples, np.hypot(M_net_samples[:, 0], M_net_samples[:, 1]))
 
         # time iteration
-        t = t + 1
+        t = t + n_frames
+        M_rrf = M_rrf_next
+        if ensemble_mode:
+            M_bins = M_bins_next
 
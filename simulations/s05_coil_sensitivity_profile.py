@@ -12,6 +12,13 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.biot_savart import along_x, biot_savart, birdcage_rungs, field_map, figure_eight, square_loop
+from engine.plotting import BufferedCurve
+from engine.sensitivity import (LoopSensitivityTable, circular_array, coil_array_sensitivities,
+                                dipole_sensitivity)
+from engine.spatial_hash import SpatialHash
+from engine.timing import FrameClock, subframe_times
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -134,30 +141,74 @@ class DipoleBox:
         self.inframe = box(pos=self.icon.pos,
                            size=vec(1.4 * self.icon.size.x, 1.4 * self.icon.size.y, self.frame.radius),
                            color=color.cyan, opacity=0.5, visible=False, pickable=False)
+        # Corners of the frame, computed once for the hit test
+        self.lower = self.inframe.pos - self.inframe.size / 2
+        self.upper = self.inframe.pos + self.inframe.size / 2
 
     def visible(self, vis):
         self.icon.visible = vis
 
     def inbox(self, point):
-        # if point in self.inframe:
-        if (self.inframe.pos.x - self.inframe.size.x / 2) <= point.x <= (
-                self.inframe.pos.x + self.inframe.size.x / 2) and \
-                (self.inframe.pos.y - self.inframe.size.y / 2) <= point.y <= (
-                self.inframe.pos.y + self.inframe.size.y / 2) and \
-                (self.inframe.pos.z - self.inframe.size.z / 2) <= point.z <= (
-                self.inframe.pos.z + self.inframe.size.z / 2):
-            return True
-        else:
-            return False
+        return (self.lower.x <= point.x <= self.upper.x and self.lower.y <= point.y <= self.upper.y and
+                self.lower.z <= point.z <= self.upper.z)
 
 
 # CREATE DIPOLE LIST FUNCTION
-dipole_list = []
+# The dipoles on the grid by id(), in the order they were placed, and a spatial hash of their positions with cells of
+# one grid unit: picking, snapping and removing a dipole take constant time however many dipoles there are, and the
+# mouse no longer has to pick among all the objects of the scene
+dipole_list = {}
+dipole_index = SpatialHash(cell_size=1)
+# The slot of each dipole, i.e. its index r_i on the canvas: dipole_slots[i] is the id() of the dipole in slot i and
+# dipole_slot maps it back. A removed dipole's slot is taken by the last dipole, so the slots stay numbered 0 to n - 1
+dipole_slots = []
+dipole_slot = {}
+PICK_RADIUS = max(dipole.size.x, dipole.size.y) / 2  # Mouse distance (grid units) within which a dipole is grabbed
 
 
 def create_dipole_list(newpos):
-    global dipole_list
-    dipole_list.append(dipole.clone(pos=vector(newpos.x, newpos.y, 0)))
+    new_dipole = dipole.clone(pos=vector(newpos.x, newpos.y, 0), pickable=False)
+    dipole_list[id(new_dipole)] = new_dipole
+    dipole_index.insert(id(new_dipole), newpos.x, newpos.y)
+    dipole_slot[id(new_dipole)] = len(dipole_slots)
+    dipole_slots.append(id(new_dipole))
+    return new_dipole
+
+
+def valid_node(x, y):
+    # Grid nodes a dipole can be snapped to: inside the grid and, for the dipole approximation, outside RESTRICTED_RADIUS
+    if not (-16 <= x <= 5 and -8 <= y <= 8):
+        return False
+    return not (dipole_approximation() and x ** 2 + y ** 2 < RESTRICTED_RADIUS ** 2)
+
+
+def remove_dipole(obj):
+    # Returns the dipole moved into the slot of the removed one, if any
+    del dipole_list[id(obj)]
+    dipole_index.remove(id(obj))
+    obj.visible = False
+    slot = dipole_slot.pop(id(obj))
+    last = dipole_slots.pop()
+    if last == id(obj):
+        return None
+    dipole_slots[slot] = last
+    dipole_slot[last] = slot
+    return dipole_list[last]
+
+
+def release_restricted_dipoles():
+    # Dipoles placed inside RESTRICTED_RADIUS with another sensitivity model, once the dipole approximation is back:
+    # snapped to the nearest free node outside it as on a drop, or removed if there is none nearby
+    if not dipole_approximation():
+        return
+    for obj in list(dipole_list.values()):
+        if obj.pos.x ** 2 + obj.pos.y ** 2 < RESTRICTED_RADIUS ** 2:
+            node = dipole_index.snap(obj.pos.x, obj.pos.y, exclude=id(obj), valid=valid_node)
+            if node is None:
+                remove_dipole(obj)
+            else:
+                obj.pos = vector(node[0], node[1], 0)
+                dipole_index.move(id(obj), node[0], node[1])
 
 
 # 'mousedown' = mouse button pressed --> execute grap() function
@@ -165,24 +216,22 @@ def create_dipole_list(newpos):
 # GRAB OBJECT (DIPOLE) FUNCTION
 def grab(object):
     global drag, dragpos, pick
-    if not play:
-        m = scene.mouse
-        p = m.pick
+    m = scene.mouse
+    # Hit tests on the box and on the spatial hash of the dipoles instead of "scene.mouse.pick"
+    key = dipole_index.nearest(m.pos.x, m.pos.y, PICK_RADIUS)
 
-        if p in [PosBox.icon]:  # <------ Grap and drag dipole from the frame
-            if p is PosBox.icon:
-                PosBox.visible(False)
+    if PosBox.inbox(vector(m.pos.x, m.pos.y, 0)):  # <------ Grap and drag dipole from the frame
+        PosBox.visible(False)
 
-            create_dipole_list(m.pos)
-            pick = dipole_list[-1]
-            drag = GRABBED_OBJECT
-            dragpos = vector(m.pos.x, m.pos.y, 0)
+        pick = create_dipole_list(m.pos)
+        drag = GRABBED_OBJECT
+        dragpos = vector(m.pos.x, m.pos.y, 0)
 
-        elif p:  # <------ Grap and drag an existing dipole from the grid
-            pick = p
-            drag = GRABBED_OBJECT
-            # dragpos = m.pos
-            dragpos = vector(m.pos.x, m.pos.y, 0)
+    elif key is not None:  # <------ Grap and drag an existing dipole from the grid
+        pick = dipole_list[key]
+        drag = GRABBED_OBJECT
+        # dragpos = m.pos
+        dragpos = vector(m.pos.x, m.pos.y, 0)
 
         # MOVE OBJECT (DIPOLE) FUNCTION
 
@@ -205,13 +254,16 @@ def move(object):
         # NOTE: -16 is the grid limit in the x-axis but we should be able to move the grabbed dipole to the frame to delete it.
         new_y = max(-8, min(m.pos.y, 8))
 
-        # CIRCULAR RESTRICTION CLOSE TO ORIGIN
-        if new_x ** 2 + new_y ** 2 <= RESTRICTED_RADIUS ** 2:
+        # CIRCULAR RESTRICTION CLOSE TO ORIGIN (only for the dipole approximation)
+        if dipole_approximation() and new_x ** 2 + new_y ** 2 <= RESTRICTED_RADIUS ** 2:
             angle = atan2(new_y, new_x)  # Calculate the angle with respect to the origin
             new_x = RESTRICTED_RADIUS * cos(angle)  # Adjust x to the circunference
             new_y = RESTRICTED_RADIUS * sin(angle)  # Adjust y to the circunference
 
         pick.pos = vector(new_x, new_y, 0)
+        dipole_index.move(id(pick), new_x, new_y)
+        if play:
+            update_contribution(pick)
     # dragpos = m.pos
     dragpos = vector(m.pos.x, m.pos.y, 0)  # <-------------------------------
 
@@ -224,16 +276,27 @@ def drop(object):
     if drag == GRABBED_OBJECT:
         # if PosBox.inbox(m.pos): # dropped back into storage box
         if PosBox.inbox(pick.pos):  # dropped back into storage box
-            dipole_list.remove(pick)
-            pick.visible = False
+            moved = remove_dipole(pick)
+            if play:
+                remove_contribution(pick)
+                # The last slot is freed, and the dipole moved out of it is labelled with its new index
+                hide_dipole_labels(len(dipole_slots))
+                if moved is not None:
+                    draw_dipole_labels(moved)
             pick = None
         else:
             #  Adjust position to grid range
             pick.pos.x = max(-16, min(pick.pos.x, 5))
             pick.pos.y = max(-8, min(pick.pos.y, 8))
 
-        if constrain:
-            pick.pos = vector(round(pick.pos.x), round(pick.pos.y), round(pick.pos.z))
+            if constrain:  # Nearest free node of the grid (the dipole stays where it is if there is none nearby)
+                node = dipole_index.snap(pick.pos.x, pick.pos.y, exclude=id(pick), valid=valid_node)
+                if node is not None:
+                    pick.pos = vector(node[0], node[1], 0)
+            dipole_index.move(id(pick), pick.pos.x, pick.pos.y)
+            if play:
+                update_contribution(pick)
+                draw_dipole_labels(pick)  # Labels and arrow of the edited dipole only
         drag = None
         PosBox.visible(True)
 
@@ -242,18 +305,6 @@ def drop(object):
 
 scene.bind('mouseup', drop)
 
-# CREATE DIPOLE LABELLING ON GRID FUNCTION
-label_list = []  # for dipoles
-
-
-def create_label_list():
-    global dipole_list, label_list
-    for i, obj in enumerate(dipole_list):
-        label_list.append(
-            label(pos=obj.pos, xoffset=2, yoffset=8, height=axis_label_height, text=f'<b>r<sub>{i}</sub></b>',
-                  opacity=0, line=False, box=False, color=color.black))
-
-
 # CALCULATION OF THE SENSITIVITY CONTRIBUTION FUNCTION AND CANVAS VISUALIZATION
 # Title "Dipoles Position" in the canvas
 label_positions = label(pos=vector(20, scene.height * 0.75, 0), pixel_pos=True, height=LABEL_HEIGHT, line=False,
@@ -265,95 +316,139 @@ label_sensitivities = label(pos=vector(scene.width * 0.76, scene.height * 0.75,
                             text='<b>Dipoles Sensitivity:</b>', visible=False)
 
 # Lists Initialization
+# One entry per dipole slot (see "dipole_slots"), reused for whichever dipole holds the slot: the objects are only
+# created when there are more dipoles than ever before, and editing one dipole updates the objects of its slot in place
 r_list = []
 c_list = []
+label_list = []  # Labels r0, r1, etc. next to the dipoles on the grid
 label_r_list = []  # Canvas Label List Position (r)
 label_c_list = []  # Canvas Label List Sensitivity
 label_sensitivity_vector = []
 sensivity_arrow_list = []
+COLOR_SENSITIVITY_VECTOR = vec(0, 0.62, 0.9)
+
+
+def add_label_slot():
+    # Hidden objects for one more slot, placed by draw_dipole_labels()
+    i = len(label_list)
+    label_list.append(label(pos=vector(0, 0, 0), xoffset=2, yoffset=8, height=axis_label_height, opacity=0, line=False,
+                            box=False, color=color.black, visible=False))
+    label_r_list.append(
+        label(pos=vector(label_positions.pos.x, label_positions.pos.y - 20 * (i + 1), 0), pixel_pos=True,
+              height=LABEL_HEIGHT, line=False, box=False, opacity=0, color=color.black, align='left', visible=False))
+    label_c_list.append(
+        label(pos=vector(label_sensitivities.pos.x, label_sensitivities.pos.y - 20 * (i + 1), 0), pixel_pos=True,
+              height=LABEL_HEIGHT, line=False, box=False, opacity=0, color=color.black, align='left', visible=False))
+    sensivity_arrow_list.append(arrow(pos=vector(0, 0, 0), axis=vector(1, 0, 0), shaftwidth=axis_thickness, round=True,
+                                      color=COLOR_SENSITIVITY_VECTOR, opacity=1, pickable=False, visible=False))
+    label_sensitivity_vector.append(label(pos=vector(0, 0, 0), xoffset=2, height=axis_label_height, opacity=0,
+                                          line=False, box=False, color=COLOR_SENSITIVITY_VECTOR, visible=False))
+    r_list.append(0)
+    c_list.append(vec(0, 0, 0))
+
+
+# Canvas visualization of the contribution of one dipole kept in "dipole_contributions" (see "compute_contributions"),
+# so redrawing the labels after an edit evaluates no sensitivity
+def draw_dipole_labels(obj):
+    i = dipole_slot[id(obj)]
+    while len(label_list) <= i:
+        add_label_slot()
+    x_r, y_r, sensitivity, rounded_sensitivity = dipole_contributions[id(obj)]
+    r_list[i] = sqrt(x_r ** 2 + y_r ** 2)
+    c_list[i] = rounded_sensitivity
+
+    label_list[i].pos = obj.pos
+    label_list[i].text = f'<b>r<sub>{i}</sub></b>'
+    label_r_list[i].text = f'<b>r<sub>{i}</sub></b> = ({x_r}, {y_r}, {obj.pos.z})<sup>T</sup>'
+    label_c_list[i].text = f'<b>c<sub>{i}</sub></b> = ({rounded_sensitivity.x}, {rounded_sensitivity.y}, {rounded_sensitivity.z})<sup>T</sup>'
+
+    # VECTOR VISUALIZATION
+    A = 0.48139
+    B = 151.6826
+    magnitude = sqrt(sensitivity.x ** 2 + sensitivity.y ** 2)
+    # Arrows no longer than at the restricted radius, which dipoles can pass with the exact sensitivity
+    scale = exp(B * min(magnitude, 2 * CONSTANT_PART / RESTRICTED_RADIUS ** 3))
+    scale_factor = scale / magnitude if magnitude > 0 else 0
+    scaled_sensitivity = vector(rounded_sensitivity.x * scale_factor, rounded_sensitivity.y * scale_factor, 0)
+    sensivity_arrow_list[i].pos = vector(x_r, y_r, obj.pos.z)
+    sensivity_arrow_list[i].axis = scaled_sensitivity
+    label_sensitivity_vector[i].pos = obj.pos + scaled_sensitivity
+    label_sensitivity_vector[i].yoffset = -3 if scaled_sensitivity.y < 0 else 3
+    label_sensitivity_vector[i].text = f'<b>c(r<sub>{i}</sub>)</b>'
+
+    for slot_object in (label_list[i], label_r_list[i], label_c_list[i], sensivity_arrow_list[i],
+                        label_sensitivity_vector[i]):
+        slot_object.visible = True
+
+
+def hide_dipole_labels(i):
+    # Objects of slot i, if it has any, kept for the next dipole in that slot
+    if i < len(label_list):
+        for slot_object in (label_list[i], label_r_list[i], label_c_list[i], sensivity_arrow_list[i],
+                            label_sensitivity_vector[i]):
+            slot_object.visible = False
 
 
 # Calculation of the Sensitivity contribution function
+# Labels and arrows of all dipoles, when playing starts and when the contributions of all dipoles change
 def calculate_sensitivity_contribution():
-    global dipole_list, r_list, CONSTANT_PART, wo_simulation, sensitivity_all_contributions, label_r_list, label_c_list
-    COLOR_SENSITIVITY_VECTOR = vec(0, 0.62, 0.9)
-
-    if len(dipole_list) != 0:
-        sensitivity_all_contributions = vec(0, 0, 0)
-        step_labels = 20  # CONSTANT TO IMPLEMENT
-        for i, obj in enumerate(dipole_list):
-            x_r = round(obj.pos.x, 1)
-            y_r = round(obj.pos.y, 1)
-
-            r = sqrt(x_r ** 2 + y_r ** 2)
-            sensitivity = (-CONSTANT_PART / r ** 5) * vector(3 * (x_r ** 2) - r ** 2, 3 * (x_r) * (y_r),
-                                                             3 * (x_r) * (obj.pos.z))
-            rounded_sensitivity = vec(round(sensitivity.x, 5), round(sensitivity.y, 5), round(sensitivity.z, 5))
-
-            r_list.append(r)
-            c_list.append(rounded_sensitivity)
-
-            # print("sensitivity ",i,": ", sensitivity)
-            # print(rounded_sensitivity)
-            # print("|c",i,"|: ", sqrt(sensitivity.x**2+sensitivity.y**2+sensitivity.z**2))
-
-            sensitivity_all_contributions = sensitivity_all_contributions + rounded_sensitivity
-
-            label_r_list.append(
-                label(pos=vector(label_positions.pos.x, label_positions.pos.y - 20 * (i + 1), 0), pixel_pos=True,
-                      height=LABEL_HEIGHT, line=False, box=False, opacity=0, color=color.black, align='left',
-                      text=f'<b>r<sub>{i}</sub></b> = ({x_r}, {y_r}, {obj.pos.z})<sup>T</sup>', visible=True))
-            label_c_list.append(
-                label(pos=vector(label_sensitivities.pos.x, label_sensitivities.pos.y - 20 * (i + 1), 0),
-                      pixel_pos=True, height=LABEL_HEIGHT, line=False, box=False, opacity=0, color=color.black,
-                      align='left',
-                      text=f'<b>c<sub>{i}</sub></b> = ({rounded_sensitivity.x}, {rounded_sensitivity.y}, {rounded_sensitivity.z})<sup>T</sup>',
-                      visible=True))
-
-            # VECTOR VISUALIZATION
-            A = 0.48139
-            B = 151.6826
-            magnitude = sqrt(sensitivity.x ** 2 + sensitivity.y ** 2)
-            scale = exp(B * magnitude)
-            scaled_sensitivity = vector(rounded_sensitivity.x * (scale / magnitude),
-                                        rounded_sensitivity.y * (scale / magnitude), 0)
-            # print("scaled_sensitivity: ", scaled_sensitivity)
-            sensivity_arrow_list.append(arrow(pos=vector(x_r, y_r, obj.pos.z),
-                                              axis=vector(scaled_sensitivity.x, scaled_sensitivity.y,
-                                                          scaled_sensitivity.z), shaftwidth=axis_thickness, round=True,
-                                              color=COLOR_SENSITIVITY_VECTOR, opacity=1, pickable=False))
-            index_sensivity_arrow_list = len(sensivity_arrow_list) - 1
-            if scaled_sensitivity.y < 0:
-                yoffset_label_sensitivity_vector = -3
-            else:
-                yoffset_label_sensitivity_vector = 3
-            label_sensitivity_vector.append(
-                label(pos=obj.pos + scaled_sensitivity, xoffset=2, yoffset=yoffset_label_sensitivity_vector,
-                      height=axis_label_height, text=f'<b>c(r<sub>{index_sensivity_arrow_list}</sub>)</b>', opacity=0,
-                      line=False, box=False, color=COLOR_SENSITIVITY_VECTOR))
-        # print("sensitivity_all_contributions", sensitivity_all_contributions)
-
-
-# DELETE LABEL LIST TYPE FUNCTION
-def delete_label_list_type(label_list_type):
-    """
-    # LISTS WITH LABEL OBJECTS THAT WE HAVE (Label list type):
-    # 1. label_list --> r0, r1, etc. that accompany the dipoles on the grid
-    # 2. label_r_list --> for the position vector of each dipole: r0, r1, etc., on the canvas
-    # 3. label_c_list --> for the sensitivity vector of each dipole: c0, c1, c2, etc., on the canvas
-    # 4. label_sensitivity_vector --> for the vector arrow of the sensitivity.
-    """
-    for lbl_object in label_list_type:
-        lbl_object.visible = False
-        lbl_object.text = ''
-    label_list_type.clear()
-
-
-# DELETE LABEL LIST TYPE FUNCTION
-def delete_sensivity_arrow_list(arrow_list):
-    for arrow_object in arrow_list:
-        arrow_object.visible = False
-    arrow_list.clear()
+    for key in dipole_slots:
+        draw_dipole_labels(dipole_list[key])
+    for i in range(len(dipole_slots), len(label_list)):
+        hide_dipole_labels(i)
+
+
+# INCREMENTAL SENSITIVITY SUMS
+# The contribution of every dipole to "sensitivity_all_contributions" (and to the sums of the coil array channels) is
+# kept per dipole, so that moving, adding or removing one dipole while playing subtracts its old contribution and adds
+# the new one instead of summing over all dipoles again
+dipole_contributions = {}  # id(dipole): (x_r, y_r, c(r), rounded c(r)) of the coil, see "dipole_contribution"
+
+
+def dipole_contribution(obj):
+    # Rounded position, sensitivity c(r) and rounded sensitivity of one dipole
+    x_r = round(obj.pos.x, 1)
+    y_r = round(obj.pos.y, 1)
+    sensitivity = vector(*coil_sensitivity(x_r, y_r, obj.pos.z).tolist())
+    rounded_sensitivity = vec(round(sensitivity.x, 5), round(sensitivity.y, 5), round(sensitivity.z, 5))
+    return x_r, y_r, sensitivity, rounded_sensitivity
+
+
+def set_contribution(obj, contribution):
+    # "contribution" from dipole_contribution(), None to take the dipole out of the sum
+    global sensitivity_all_contributions
+    old_contribution = dipole_contributions.pop(id(obj), None)
+    if old_contribution is not None:
+        sensitivity_all_contributions = sensitivity_all_contributions - old_contribution[3]
+    if contribution is not None:
+        sensitivity_all_contributions = sensitivity_all_contributions + contribution[3]
+        dipole_contributions[id(obj)] = contribution
+
+
+def update_contribution(obj):
+    # New position of one dipole: coil and coil array sums
+    set_contribution(obj, dipole_contribution(obj))
+    if array_mode:
+        set_array_contribution(obj, coil_array_sensitivities(array_centers, array_angles,
+                                                             [[obj.pos.x, obj.pos.y, obj.pos.z]],
+                                                             loop_sensitivity_table)[:, 0])
+
+
+def remove_contribution(obj):
+    set_contribution(obj, None)
+    if array_mode:
+        set_array_contribution(obj, np.zeros(3))
+        array_contributions.pop(id(obj))
+
+
+def compute_contributions():
+    # All dipoles from scratch: when playing starts and when the coil or the sensitivity model changes
+    global sensitivity_all_contributions
+    sensitivity_all_contributions = vec(0, 0, 0)
+    dipole_contributions.clear()
+    for obj in dipole_list.values():
+        set_contribution(obj, dipole_contribution(obj))
+    update_array_sensitivities()
 
 
 # SET CONSNTRAINT FUNCTION
@@ -370,11 +465,11 @@ play = False
 
 
 def run_play(b):
-    global play, label_list, label_r_list, label_c_list, r_list, c_list, t, t_g, sensivity_arrow_list
+    global play, t, t_g
     play = not play
     if play:
         b.text = "Pause"
-        create_label_list()
+        compute_contributions()
         calculate_sensitivity_contribution()
         label_positions.visible = True
         label_sensitivities.visible = True
@@ -384,17 +479,15 @@ def run_play(b):
         b.text = "Play"
         label_positions.visible = False  # Title
         label_sensitivities.visible = False  # Title
-        delete_label_list_type(label_list)
-        delete_label_list_type(label_r_list)
-        delete_label_list_type(label_c_list)
-        delete_label_list_type(label_sensitivity_vector)
-        r_list.clear()
-        c_list.clear()
-        delete_sensivity_arrow_list(sensivity_arrow_list)
+        for i in range(len(label_list)):
+            hide_dipole_labels(i)
         t = 0
         t_g = 0
         mflux_graph.delete()
         emf_graph.delete()
+        for flux_curve, emf_curve in array_graphs:
+            flux_curve.delete()
+            emf_curve.delete()
 
 
 # GRID CLASS
@@ -402,14 +495,16 @@ class Grid:
     def __init__(self):
         global RESTRICTED_RADIUS
         self.grid_points = []
+        self.restricted_points = []  # Close to the coil, only used with the exact sensitivity
         #print(f"-x_neg_axis.length = {int(-x_neg_axis.length)}")
         #print(f"-x_neg_axis.length = {y_axis.length + 1}")
         for x in range(int(-x_neg_axis.length), int(x_axis.length + 1)):
             for y in range(int(-y_neg_axis.length), int(y_axis.length + 1)):
                 # self.grid_points.append(sphere(pos=vector(x,y,0), radius=0.05, color=color.black, pickable=False))
                 if x ** 2 + y ** 2 <= RESTRICTED_RADIUS ** 2:
-                    self.grid_points.append(
+                    self.restricted_points.append(
                         sphere(pos=vector(x, y, 0), radius=0.05, color=color.white, pickable=False, visible=False))
+                    self.grid_points.append(self.restricted_points[-1])
                 else:
                     self.grid_points.append(sphere(pos=vector(x, y, 0), radius=0.05, color=color.black, pickable=False))
 
@@ -417,9 +512,15 @@ class Grid:
         for s in self.grid_points:
             s.visible = vis
 
+    def restricted_visible(self, vis):
+        for s in self.restricted_points:
+            s.color = color.black
+            s.visible = vis
+
 
 # PLAY BUTTON
 button(text="Play", pos=scene.title_anchor, bind=run_play)
+wtext_fps = wtext(pos=scene.title_anchor, text='')  # Achieved vs requested frame rate
 
 # PROGRAM DESCRIPTION
 scene.append_to_caption('  <b>COIL SENSITIVITY PROFILE \n')
@@ -454,7 +555,16 @@ scene.append_to_caption('''
    some dipoles on the grid. You can drag and drop the dipoles 
    from the black frame to the grid, and delete them by 
    dragging them back to the frame. Additionally, below you 
-   can modify the strength of the main magnetic field (B<sub>0</sub>).\n\n\n''')
+   can modify the strength of the main magnetic field (B<sub>0</sub>)
+   and show the sensitivity map |<b>c(r)</b>| over the whole grid. 
+   The exact sensitivity of the coil (from elliptic integrals) 
+   replaces the far-field approximation, so that dipoles can 
+   also be placed close to the coil. Besides the ring, you can 
+   select other receive coils (a square surface coil, a 
+   figure-eight coil and the rungs of a birdcage), whose 
+   sensitivity is computed from their wires by Biot-Savart. The 
+   coil array adds a ring of receive channels around the grid, 
+   each with its own flux and emf graph.\n\n\n''')
 
 
 # |Bo| SELECTION FUNCTION
@@ -472,6 +582,182 @@ wt_Bo = wtext(text='{:1.1f}'.format(slider_Bo.value))
 
 scene.append_to_caption('T\n\n')
 
+# SENSITIVITY MODEL
+# The dipole approximation of c(r) only holds far away from the coil (outside RESTRICTED_RADIUS). The exact sensitivity
+# of the coil ring is looked up in a table computed once from elliptic integrals, so dipoles can be placed anywhere
+exact_sensitivity = False
+
+# Receive coils besides the ring, given by their wire paths (polylines in scene units) with the currents oriented like
+# the surface vector S of the ring. By reciprocity c(r) is their field per unit current (Biot-Savart), scaled like the
+# ring: CONSTANT_PART stands for mu0*S/(4*pi) with S = pi*r_coil^2
+square_lines, square_currents = square_loop(2 * coil.radius)
+eight_lines, eight_currents = figure_eight(coil.radius)
+rung_lines, rung_currents = birdcage_rungs(4 * coil.radius, 2 * y_axis.length)
+COILS = {'Ring': None,
+         'Square surface coil': (along_x(square_lines), -square_currents),
+         'Figure-eight coil': (along_x(eight_lines), -eight_currents),
+         'Birdcage rungs': (rung_lines, rung_currents)}
+selected_coil = None  # Wire paths and currents, None for the ring
+
+# Wire paths of the coils
+coil_paths = {}
+for coil_name, coil_geometry in COILS.items():
+    if coil_geometry is not None:
+        coil_paths[coil_name] = [curve(pos=[vector(*point) for point in line.tolist()], radius=coil.thickness,
+                                       color=color.black, visible=False, pickable=False) for line in coil_geometry[0]]
+
+
+def dipole_approximation():
+    # Whether c(r) is the far-field approximation of the ring, which keeps the dipoles outside RESTRICTED_RADIUS
+    return selected_coil is None and not exact_sensitivity
+
+
+def coil_sensitivity(x, y, z, cache=False):
+    # c(r) (array of shape (..., 3)) of the selected coil and model. "cache": keep the result on disk (field maps)
+    if selected_coil is not None:
+        polylines, currents = selected_coil
+        field_points = np.stack(np.broadcast_arrays(x, y, z), axis=-1)
+        if cache:
+            B = field_map(polylines, currents, field_points.reshape(-1, 3))
+        else:
+            B = biot_savart(polylines, currents, field_points.reshape(-1, 3))
+        return CONSTANT_PART * 4 / (VACUUM_PERMEABILITY * coil.radius ** 2) * B.reshape(field_points.shape)
+    if exact_sensitivity:
+        return loop_sensitivity_table(x, y, z)
+    return dipole_sensitivity(x, y, z, CONSTANT_PART)
+
+
+def set_coil(m):
+    global selected_coil
+    selected_coil = COILS[m.selected]
+
+    # Drawing of the selected coil
+    for ring_element in [coil, arrow_S, label_S]:
+        ring_element.visible = selected_coil is None
+    for coil_name in coil_paths:
+        for path in coil_paths[coil_name]:
+            path.visible = coil_name == m.selected
+    grid.restricted_visible(not dipole_approximation())
+    release_restricted_dipoles()
+    if play:
+        compute_contributions()
+        calculate_sensitivity_contribution()
+
+    # Map of the selected coil
+    sensitivity_map_points.clear()
+    set_sensitivity_map(checkbox_map)
+
+
+def set_exact_sensitivity(b):
+    global exact_sensitivity
+    exact_sensitivity = b.checked
+    grid.restricted_visible(not dipole_approximation())
+    release_restricted_dipoles()
+    if play:
+        compute_contributions()
+        calculate_sensitivity_contribution()
+
+    # Map of the selected model
+    sensitivity_map_points.clear()
+    set_sensitivity_map(checkbox_map)
+
+
+# SENSITIVITY MAP
+# |c(r)| over the grid (outside RESTRICTED_RADIUS for the dipole approximation) every SENSITIVITY_MAP_STEP, evaluated
+# in one call and drawn behind the grid as one points object, colored on a logarithmic scale since c(r) drops
+# cubically with r
+SENSITIVITY_MAP_STEP = 0.25
+COLOR_SENSITIVITY_MAP = np.array([0, 0.62, 0.9])
+sensitivity_map_points = points(radius=4, visible=False, pickable=False)
+
+
+def sensitivity_map(step=SENSITIVITY_MAP_STEP):
+    # Coordinates and colors of the map points
+    x, y = np.meshgrid(np.arange(-x_neg_axis.length, x_axis.length + step / 2, step),
+                       np.arange(-y_neg_axis.length, y_axis.length + step / 2, step))
+    x, y = x.ravel(), y.ravel()
+    if dipole_approximation():
+        outside = x ** 2 + y ** 2 > RESTRICTED_RADIUS ** 2
+        x, y = x[outside], y[outside]
+    log_c = np.log10(np.maximum(np.linalg.norm(coil_sensitivity(x, y, 0, cache=True), axis=-1), 1E-12))
+    level = (log_c - log_c.min()) / (log_c.max() - log_c.min())
+    return x, y, 1 - level[:, None] * (1 - COLOR_SENSITIVITY_MAP)
+
+
+def set_sensitivity_map(b):
+    if b.checked and sensitivity_map_points.npoints == 0:
+        x, y, colors = sensitivity_map()
+        sensitivity_map_points.append([{'pos': vector(x_i, y_i, -0.1), 'color': vector(*rgb)}
+                                       for x_i, y_i, rgb in zip(x.tolist(), y.tolist(), colors.tolist())])
+    sensitivity_map_points.visible = b.checked
+
+
+scene.append_to_caption('      ')
+checkbox_map = checkbox(bind=set_sensitivity_map, text='Show sensitivity map |<b>c(r)</b>|', checked=False)
+scene.append_to_caption('\n      ')
+checkbox(bind=set_exact_sensitivity, text='Exact sensitivity of the coil (dipoles anywhere)', checked=False)
+scene.append_to_caption('\n      Coil: ')
+menu(choices=list(COILS), bind=set_coil)
+
+# COIL ARRAY
+# ARRAY_CHANNELS (8 to 64) rings like the coil, evenly spaced on a circle around the grid and facing outwards. The
+# sensitivities of all channels at all dipoles form one (channels x dipoles x 3) array (exact ring profile), whose sum
+# over the dipoles gives the fluxes and emfs of all channels per frame with one einsum each. Each channel has a small
+# graph
+ARRAY_CHANNELS = 16
+ARRAY_RADIUS = 12
+ARRAY_CENTER = (-5.5, 0, 0)  # Center of the grid
+COLOR_ARRAY = vector(0.4, 0.4, 0.4)
+array_centers, array_angles = circular_array(ARRAY_CHANNELS, ARRAY_RADIUS, ARRAY_CENTER)
+array_rings = [ring(pos=vector(*center), axis=vector(cos(angle), sin(angle), 0), radius=coil.radius,
+                    thickness=coil.thickness, color=COLOR_ARRAY, visible=False, pickable=False)
+               for center, angle in zip(array_centers.tolist(), array_angles.tolist())]
+array_mode = False
+array_sensitivities = np.zeros((ARRAY_CHANNELS, 3))  # Sum over the dipoles per channel
+array_contributions = {}  # id(dipole): c(r) of all channels (channels x 3)
+array_graphs = []  # (flux, emf) curves per channel, created when the array is first shown
+
+
+def update_array_sensitivities():
+    # All channels at all dipoles in one (channels x dipoles x 3) array, kept per dipole for incremental updates
+    global array_sensitivities
+    dipole_positions = np.array([[obj.pos.x, obj.pos.y, obj.pos.z] for obj in dipole_list.values()]).reshape(-1, 3)
+    channel_sensitivities = coil_array_sensitivities(array_centers, array_angles, dipole_positions,
+                                                     loop_sensitivity_table)
+    array_contributions.clear()
+    for i, obj in enumerate(dipole_list.values()):
+        array_contributions[id(obj)] = channel_sensitivities[:, i]
+    array_sensitivities = channel_sensitivities.sum(axis=1)
+
+
+def set_array_contribution(obj, contribution):
+    global array_sensitivities
+    array_sensitivities = array_sensitivities + contribution - array_contributions.get(id(obj), 0)
+    array_contributions[id(obj)] = contribution
+
+
+def set_array_mode(b):
+    global array_mode
+    array_mode = b.checked
+    for array_ring in array_rings:
+        array_ring.visible = array_mode
+    update_array_sensitivities()
+
+    # Small multiples: one graph per channel
+    if array_mode and array_graphs == []:
+        for k in range(ARRAY_CHANNELS):
+            channel_graph = graph(width=scene.width / 4, height=scene.width / 8, fast=True,
+                                  title='<b>Channel {}</b>'.format(k), xtitle='Time (ns)', scroll=True, xmin=0,
+                                  xmax=300, align='left')
+            array_graphs.append((BufferedCurve(gcurve(color=color.blue, label='<i>\u03A6(t)</i>', graph=channel_graph)),
+                                 BufferedCurve(gcurve(color=color.red, label='<i>emf/\u03C9<sub>0</sub></i>',
+                                                      graph=channel_graph))))
+
+
+scene.append_to_caption('\n      ')
+checkbox(bind=set_array_mode, text='Coil array ({} channels)'.format(ARRAY_CHANNELS), checked=False)
+scene.append_to_caption('\n\n')
+
 # SCALE FACTOR DESCRIPTION
 # scene.append_to_caption('\n')
 scene.append_to_caption('''      
@@ -486,10 +772,10 @@ scene.append_to_caption('''
 # GRAPHS
 graph_1 = graph(width=scene.width / 2, height=scene.width / 6, fast=False, title='<b>Magnetic Flux \u03A6(t)</b>',
                 xtitle='Time (ns)', ymin=-0.1, ymax=0.1, scroll=True, xmin=0, xmax=300, align='left')
-mflux_graph = gcurve(color=color.blue, label='<i>\u03A6(t)</i>', graph=graph_1)
+mflux_graph = BufferedCurve(gcurve(color=color.blue, label='<i>\u03A6(t)</i>', graph=graph_1))
 graph_2 = graph(width=scene.width / 2, height=scene.width / 6, fast=False, title='<b>Electromotive Force (emf)</b>',
                 xtitle='Time (ns)', ymin=-10000000, ymax=10000000, scroll=True, xmin=0, xmax=300, align='left')
-emf_graph = gcurve(color=color.red, label='<i>emf</i>', graph=graph_2)
+emf_graph = BufferedCurve(gcurve(color=color.red, label='<i>emf</i>', graph=graph_2))
 
 
 # RESET FUNCTION
@@ -500,7 +786,7 @@ def reset_animation():
 
 # SCENE CREATION
 # Creating the Grid
-Grid()
+grid = Grid()
 # Creating Dipole Frame/Box
 PosBox = DipoleBox()
 
@@ -514,6 +800,7 @@ Mo = 1
 
 # ANIMATION PARAMETERS
 RATEVALUE = 30  # Frames per second
+SAMPLES_PER_FRAME = 64  # Physics samples per frame (about 2 kHz)
 
 SCALE_FACTOR = 3831841466
 TIME_FACTOR = 7.829
@@ -527,14 +814,24 @@ COIL_SURFACE = 1E7
 # CONSTANT_PART= (VACUUM_PERMEABILITY * COIL_SURFACE)/(4*pi)
 CONSTANT_PART = 1  # For simplification
 
+# Exact sensitivity of the coil ring over the grid, tabulated once (points inside the wire see its surface)
+loop_sensitivity_table = LoopSensitivityTable(coil.radius, CONSTANT_PART, extent=(x_neg_axis.length, y_axis.length),
+                                              min_distance=coil.thickness)
+
 # TIME INITIALIZATION
 t = 0
 t_g = 0
 
+# Frames due per iteration by the wall clock
+clock = FrameClock(RATEVALUE)
+
 # ITERATION OVER TIME
 while True:
 
     rate(RATEVALUE)  # Limit the animation to run at a maximum of 'rate_value' frames per second
+    n_frames = clock.tick()  # Frames due by the wall clock, including dropped ones
+    if play and clock.report_due():  # About once a second, not every frame
+        wtext_fps.text = '   ' + clock.report()
     if play:
 
         # Frequencies calculation
@@ -555,24 +852,41 @@ while True:
 
         # Rotation of the Dipoles
         if len(dipole_list) != 0:
-            for i, obj in enumerate(dipole_list):
+            for obj in dipole_list.values():
                 obj.axis = vector(dipole.size.x * cos(wo_simulation * t), dipole.size.y * sin(wo_simulation * t), 0)
 
+        # All samples of this frame in one call
+        t_samples = subframe_times(t, SAMPLES_PER_FRAME, n_frames)
+        t_g_samples = t_samples * TIME_FACTOR / RATEVALUE
+        c = np.array([sensitivity_all_contributions.x, sensitivity_all_contributions.y,
+                      sensitivity_all_contributions.z])
+
         # Definition of the magnetization vector (Dipole Spin)
-        Magnetization_vector = Mo * vector(cos(wo_simulation * t), sin(wo_simulation * t), 0)
+        Magnetization_samples = Mo * np.stack((np.cos(wo_simulation * t_samples), np.sin(wo_simulation * t_samples),
+                                               np.zeros_like(t_samples)), axis=-1)
 
         # Calculation of the Magnetic Flux
-        magnetic_flux = dot(Magnetization_vector, sensitivity_all_contributions)
+        magnetic_flux = Magnetization_samples @ c
         # print("magnetic_flux: ", magnetic_flux)
-        mflux_graph.plot(t_g, magnetic_flux)
+        mflux_graph.plot(t_g_samples, magnetic_flux)
 
         # Calculation of the Electromotive Force
-        emf = -Mo * dot(vector(-sin(wo_simulation * t) * wo, cos(wo_simulation * t) * wo, 0),
-                        sensitivity_all_contributions)
-        emf_graph.plot(t_g, emf)
+        emf = -Mo * wo * (-np.sin(wo_simulation * t_samples) * c[0] + np.cos(wo_simulation * t_samples) * c[1])
+        emf_graph.plot(t_g_samples, emf)
+
+        # Fluxes and emfs of all channels of the coil array (sensitivities summed over the dipoles), one einsum each
+        if array_mode:
+            dMagnetization_samples = Mo * wo * np.stack((-np.sin(wo_simulation * t_samples),
+                                                         np.cos(wo_simulation * t_samples), np.zeros_like(t_samples)),
+                                                        axis=-1)
+            array_flux = np.einsum('kj,tj->kt', array_sensitivities, Magnetization_samples)
+            array_emf = -np.einsum('kj,tj->kt', array_sensitivities, dMagnetization_samples)
+            for (flux_curve, emf_curve), flux, channel_emf in zip(array_graphs, array_flux, array_emf):
+                flux_curve.plot(t_g_samples, flux)
+                emf_curve.plot(t_g_samples, channel_emf / wo)
 
         # Time scaling for the graphs
         t_g = t * TIME_FACTOR / RATEVALUE
 
         # time iteration
-        t = t + 1
+        t = t + n_frames
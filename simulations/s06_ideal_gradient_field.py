@@ -12,6 +12,11 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.cache import LRUCache
+from engine.contours import isolines
+from engine.gradients import (concomitant_field, gradient_field, lattice, phase_encoding_gradients,
+                              phase_maps)
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -89,16 +94,31 @@ cylinder_label_isolines = cylinder(pos=label_isolines.pos - vector(0, 0, 4), axi
 
 
 # DELETE GRADIENT OBJECTS
+# The objects are pooled (see "ObjectPool"): hiding them returns them to the pool for the next plot
 def delete_objects(object_list_item):
     for value_element in object_list_item:
         value_element.visible = False
     object_list_item.clear()
 
 
+# OBJECT POOL
+class ObjectPool:
+    # Scene objects created once per key (e.g. a grid position) and then reused, so that moving the sliders only
+    # updates attributes in place and the number of objects in the scene stays constant
+    def __init__(self, factory):
+        self.factory = factory
+        self.objects = {}
+
+    def get(self, key):
+        if key not in self.objects:
+            self.objects[key] = self.factory()
+        return self.objects[key]
+
+
 # SET GRADIENTS <------------------------------------------------------------------------------------------------------
 # Dictonaries to store gradient information
 gradients_object_dict = {'x': None, 'y': None, 'z': None}  # dictionary
-gradients_length_dict = {'x': [0, 0, 0, 0, 0], 'y': [0, 0, 0, 0, 0], 'z': [0, 0, 0, 0, 0]}  # dictionary
+gradients_strength_dict = {'x': 0, 'y': 0, 'z': 0}  # dictionary (mT/m)
 
 # Gradient features
 arrows_thickness = axis_thickness * 1.4
@@ -106,6 +126,38 @@ sphere_radio = 0.075
 COLOR_SENSITIVITY_VECTOR = vec(0, 0.62, 0.9)
 COLOR_GRADIENTS = vector(0, 0.7, 1)
 
+# Pools of the gradient objects (arrows and spheres) and of the iso-line curves
+arrow_pool = ObjectPool(lambda: arrow(axis=vector(0, 0, 1), shaftwidth=arrows_thickness, round=True,
+                                      color=COLOR_GRADIENTS, opacity=1, pickable=False, visible=False))
+sphere_pool = ObjectPool(lambda: sphere(radius=sphere_radio, color=COLOR_GRADIENTS, pickable=False, visible=False))
+isoline_pool = ObjectPool(lambda: curve(radius=0.05, color=COLOR_ISOLINES, visible=False))
+
+# Concomitant (Maxwell) field layer: wider translucent arrows around the gradient objects, scaled so that the largest
+# deviation of the view has the length MAXWELL_ARROW_LENGTH. Scene units are SCENE_UNIT meters (lattice: +-10 cm in
+# x and y, +-20 cm in z)
+SCENE_UNIT = 0.025  # m
+MAXWELL_B0 = 1.5  # T
+MAXWELL_ARROW_LENGTH = 2
+COLOR_MAXWELL = vector(1, 0.5, 0)
+maxwell_pool = ObjectPool(lambda: arrow(axis=vector(0, 0, 1), shaftwidth=arrows_thickness * 2.5, round=True,
+                                        color=COLOR_MAXWELL, opacity=0.5, pickable=False, visible=False))
+
+
+def gradient_object(position, arrow_value, object_opacity=1, radius=sphere_radio):
+    # Pooled sphere (no field) or arrow (field "arrow_value") at the grid position, updated in place and shown
+    key = ('grid', position.x, position.y, position.z)
+    if arrow_value == 0:
+        gradient_element = sphere_pool.get(key)
+        gradient_element.radius = radius
+    else:
+        gradient_element = arrow_pool.get(key)
+        gradient_element.axis = vector(0, 0, arrow_value)
+    gradient_element.pos = position
+    gradient_element.opacity = object_opacity
+    gradient_element.visible = True
+    return gradient_element
+
+
 # Lists to store the gradient objects that represent the gradient field in XZ, YZ and XY planes
 gradients_xzPlane_list = []
 gradients_yzPlane_list = []
@@ -122,14 +174,106 @@ gradients_volume_list = []
 current_gradient = None
 
 # Coordinates in each axis where gradients are displayed
-coord_x = list(range(-4, 5, 2))  # e.g. coord_x: [-4, -2, 0, 2, 4]
-coord_y = list(range(-4, 5, 2))
-coord_z = list(range(-8, 9, 4))  # e.g. coord_y: [-8, -4, 0, 4, 8]
+coord_x = np.arange(-4, 5, 2)  # e.g. coord_x: [-4, -2, 0, 2, 4]
+coord_y = np.arange(-4, 5, 2)
+coord_z = np.arange(-8, 9, 4)  # e.g. coord_y: [-8, -4, 0, 4, 8]
+LATTICE_STEP = (2, 2, 4)  # Distance between neighbouring gradient objects along x, y and z
+
+# Sample grid of the volume view (VOLUME_INTERVALS + 1 samples per axis over the lattice). The view shows every
+# stride-th sample, with the stride (one of VOLUME_STRIDES) chosen from the camera distance and the field magnitude.
+# The coarsest stride gives the lattice above
+VOLUME_INTERVALS = 32
+VOLUME_STRIDES = (1, 2, 4, 8)
+volume_x = np.linspace(coord_x[0], coord_x[-1], VOLUME_INTERVALS + 1)
+volume_y = np.linspace(coord_y[0], coord_y[-1], VOLUME_INTERVALS + 1)
+volume_z = np.linspace(coord_z[0], coord_z[-1], VOLUME_INTERVALS + 1)
+MAX_VOLUME_ARROWS = 800  # Arrows and spheres drawn at most (the frame rate drops with the number of objects)
+MIN_ARROW_PIXELS = 24  # Minimum distance between neighbouring arrows on the screen
+ARROW_OVERLAP = 2  # Longest arrow in units of the distance between neighbouring arrows along z
+VOLUME_POINTS = True  # Distant views show the field as one "points" object colored by the field value
+MIN_POINT_PIXELS = 4  # Minimum distance between neighbouring points on the screen
+
+
+def display_field(x, y, z):
+    # Arrow lengths of the current gradients at the coordinates x, y, z (arrays): G.r / G_max with r counted in lattice
+    # steps, e.g. Gx = 40 mT/m gives the lengths [-2, -1, 0, 1, 2] along x
+    G = [gradients_strength_dict[key] / slider_Gx.max for key in 'xyz']
+    return gradient_field(G, *(np.divide(c, step) for c, step in zip((x, y, z), LATTICE_STEP)))
+
+
+# Single object for the volume view from far away, colored from negative (blue) over zero (gray) to positive (red)
+volume_points = points(radius=3, visible=False, pickable=False)
+COLOR_FIELD_NEGATIVE = np.array([0, 0.45, 0.9])
+COLOR_FIELD_ZERO = np.array([0.75, 0.75, 0.75])
+COLOR_FIELD_POSITIVE = np.array([0.9, 0.2, 0.1])
+
+
+def field_colors(values):
+    # RGB rows for the field values, scaled by the largest magnitude
+    t = np.asarray(values, dtype=float)[:, None] / max(np.abs(values).max(), 1E-12)
+    return np.where(t < 0, COLOR_FIELD_ZERO + (COLOR_FIELD_ZERO - COLOR_FIELD_NEGATIVE) * t,
+                    COLOR_FIELD_ZERO + (COLOR_FIELD_POSITIVE - COLOR_FIELD_ZERO) * t)
+
+
+# Geometry computed per configuration (Gx, Gy, Gz, view, iso-lines on/off), so that revisiting a configuration with
+# the sliders only applies the stored arrays to the pooled objects. The least recently used entries are evicted once
+# the arrays take more than RENDER_CACHE_BYTES
+RENDER_CACHE_BYTES = 32 * 2 ** 20
+render_cache = LRUCache(RENDER_CACHE_BYTES)
+
+
+def render_key(view):
+    return tuple(gradients_strength_dict[key] for key in 'xyz') + (view, bool(button_isolines.activated))
+
+
+def lattice_geometry(x, y, z, faded=False):
+    # Positions, arrow lengths and opacities of the gradient objects at the coordinates x, y, z (arrays that broadcast
+    # to the lattice) outside the corners of the x-y plane, in the order of the lattice.
+    # "faded": only the objects on the axes (at least two coordinates zero) are opaque
+    positions = np.stack(np.broadcast_arrays(x, y, z), axis=-1).reshape(-1, 3)
+    arrow_values = display_field(positions[:, 0], positions[:, 1], positions[:, 2])
+    inside = ~((np.abs(positions[:, 0]) == coord_x[-1]) & (np.abs(positions[:, 1]) == coord_y[-1]))
+    if faded:
+        opacities = np.where(np.count_nonzero(positions == 0, axis=1) >= 2, 1, 0.2)
+    else:
+        opacities = np.ones(len(positions))
+
+    return positions[inside], arrow_values[inside], opacities[inside]
+
+
+def maxwell_geometry(key, positions):
+    # Concomitant field (T) at the positions of a view, cached per gradient setting ("key" of the view)
+    G = [gradients_strength_dict[key] * 1E-3 for key in 'xyz']
+    return render_cache.get_or_compute(key + ('maxwell',),
+                                       lambda: concomitant_field(G, *(positions.T * SCENE_UNIT), B0=MAXWELL_B0))
+
+
+def show_maxwell(positions, values, object_list, arrows=True):
+    # Shows the concomitant field layer of a view (deviations from the ideal field along z).
+    # "arrows": False to only display the largest deviation, e.g. when the view is drawn as points
+    peak = values.max(initial=0)
+    wtext_maxwell.text = '  max. {:1.1f} \u00B5T'.format(peak * 1E6)
+    if peak == 0 or not arrows:
+        return
+    for position, value in zip(positions.tolist(), (values * MAXWELL_ARROW_LENGTH / peak).tolist()):
+        if value > 1E-3:
+            maxwell_element = maxwell_pool.get(('grid',) + tuple(position))
+            maxwell_element.pos = vector(*position)
+            maxwell_element.axis = vector(0, 0, value)
+            maxwell_element.visible = True
+            object_list.append(maxwell_element)
+
+
+def show_lattice(geometry, object_list, radius=sphere_radio):
+    # Shows the gradient objects of a (cached) lattice geometry
+    positions, arrow_values, opacities = geometry
+    for position, arrow_value, object_opacity in zip(positions.tolist(), arrow_values.tolist(), opacities.tolist()):
+        object_list.append(gradient_object(vector(*position), arrow_value, object_opacity, radius))
 
 
 # Sliders Function
 def set_sliders(s):
-    global gradients_object_dict, gradients_length_dict, current_gradient
+    global gradients_object_dict, gradients_strength_dict, current_gradient
     global gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list
     global coord_x, coord_y, coord_z
 
@@ -167,25 +311,24 @@ def set_sliders(s):
     else:
         print('CONDITION NOT INCLUDED')
 
-    # 3D objects that represent the gradients over the "s.gradient" axis
-    arrow_01 = arrow(pos=vector(x_i, y_i, z_i), axis=vector(0, 0, 1) * s.value / s.max, shaftwidth=arrows_thickness,
-                     round=True, color=COLOR_GRADIENTS, opacity=1, pickable=False, visible=False)
-    arrow_02 = arrow(pos=arrow_01.pos * 2, axis=arrow_01.axis * 2, shaftwidth=arrows_thickness, round=True,
-                     color=COLOR_GRADIENTS, opacity=1, pickable=False, visible=False)
-    arrow_neg01 = arrow(pos=arrow_01.pos * -1, axis=arrow_01.axis * -1, shaftwidth=arrows_thickness, round=True,
-                        color=COLOR_GRADIENTS, opacity=1, pickable=False, visible=False)
-    arrow_neg02 = arrow(pos=arrow_01.pos * -2, axis=arrow_01.axis * -2, shaftwidth=arrows_thickness, round=True,
-                        color=COLOR_GRADIENTS, opacity=1, pickable=False, visible=False)
-    sphere_center = sphere(pos=vector(0, 0, 0), radius=sphere_radio, color=COLOR_GRADIENTS, pickable=False)
+    # 3D objects that represent the gradients over the "s.gradient" axis (taken from the pool, updated in place)
+    arrow_01 = arrow_pool.get(('axis', s.gradient, 1))
+    arrow_02 = arrow_pool.get(('axis', s.gradient, 2))
+    arrow_neg01 = arrow_pool.get(('axis', s.gradient, -1))
+    arrow_neg02 = arrow_pool.get(('axis', s.gradient, -2))
+    for factor, gradient_element in zip([1, 2, -1, -2], [arrow_01, arrow_02, arrow_neg01, arrow_neg02]):
+        gradient_element.pos = vector(x_i, y_i, z_i) * factor
+        gradient_element.axis = vector(0, 0, 1) * s.value / s.max * factor
+        gradient_element.visible = False
+    sphere_center = sphere_pool.get(('axis', s.gradient, 0))
+    sphere_center.pos = vector(0, 0, 0)
+    sphere_center.visible = not radio_phase.checked  # Hidden with the other gradient objects in phase-encoding mode
 
     # Assigning an array with the gradient objects for the corresponding axes to the "s.gradient" key
     gradients_object_dict[s.gradient] = [arrow_neg02, arrow_neg01, sphere_center, arrow_01, arrow_02]
 
-    # Assigning an array with the length of the gradient objects to "gradients_length_dict[s.gradient]"
-    dict_vector = [-arrow_neg02.length, -arrow_neg01.length, 0, arrow_01.length, arrow_02.length]
-    s_value_sign = sign(s.value)
-    gradients_length_dict[s.gradient] = [dict_element * s_value_sign for dict_element in dict_vector]
-    # e.g.  GX = 40 mT/m then s.value = 40/ s.gradient = 'x' / gradients_length_dict['x'] = [-2, -1, 0, 1, 2]
+    # Strength of the "s.gradient" gradient, from which the field on the plane and volume lattices is evaluated
+    gradients_strength_dict[s.gradient] = s.value
 
     # CONDITIONALS FOR SELECTING PLOT VISUALIZATION MODE (AXIS, PLANE OR VOLUME)
     # For "Axis":<----------------------
@@ -255,8 +398,14 @@ scene.append_to_caption('''
     Below, you can adjust the strength of the gradient field. You can choose
     to view the gradients along an axis, in a plane, or throughout the entire 
     scanner. In plane mode, you can also enable the option to display 
-    iso-lines. Additionally, you can switch the camera view between different 
-    planes or use a free view mode to rotate the scene.
+    iso-lines. In plane and volume mode, the Maxwell terms show the 
+    concomitant field 
+        B<sub>c</sub> = [(G<sub>x</sub>z - G<sub>z</sub>x/2)² + (G<sub>y</sub>z - G<sub>z</sub>y/2)²] / (2B<sub>o</sub>), 
+    the deviation from the ideal field (orange, at B<sub>o</sub> = 1.5 T). 
+    In phase-encoding mode, you can step through the phase maps
+    exp(-iγ<b>G</b>·<b>r</b>τ) that the phase-encoding gradients G<sub>y</sub> imprint
+    on the x-y plane. Additionally, you can switch the camera view between 
+    different planes or use a free view mode to rotate the scene.
     \n''')
 
 # GRADIENTS
@@ -293,11 +442,19 @@ def set_plot_axis(r, from_plot=True):
     global gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list
     global gradients_volume_list
 
+    phase_points.visible = False
+
     # Deactivating and Disabling Iso-lines button
     button_isolines.activated = False
     button_isolines.background = color.white
     button_isolines.disabled = True
 
+    # Deactivating and Disabling Maxwell button
+    button_maxwell.activated = False
+    button_maxwell.background = color.white
+    button_maxwell.disabled = True
+    wtext_maxwell.text = ''
+
     # Cleaning gradient plane lists:
     if gradients_xyPlane_list != []:
         delete_objects(gradients_xyPlane_list)
@@ -328,286 +485,82 @@ def set_plot_axis(r, from_plot=True):
             element.visible = True
 
 
+def set_plane(view, x, y, z, gradients_plane_list, isolines_plane_list, faded=False):
+    # Gradient objects and iso-lines of one plane (x, y, z broadcast to the lattice of the plane), taken from the
+    # cache if the configuration was displayed before. Iso-lines are only computed while they are shown
+    geometry = render_cache.get(render_key(view))
+    if geometry is None:
+        lattice_values = lattice_geometry(x, y, z, faded)
+        if button_isolines.activated == True:
+            polylines = isoline_geometry(x, y, z, lattice_values[1])
+        else:
+            polylines = []
+        geometry = (lattice_values, polylines)
+        render_cache.put(render_key(view), geometry)
+
+    show_lattice(geometry[0], gradients_plane_list)
+    show_isolines(geometry[1], isolines_plane_list)
+    if button_maxwell.activated == True:
+        positions = geometry[0][0]
+        show_maxwell(positions, maxwell_geometry(render_key(view), positions), gradients_plane_list)
+
+
 def set_plot_plane(r):
-    global gradients_volume_list, gradients_length_dict, coord_x, coord_y, coord_z
+    global gradients_volume_list, gradients_strength_dict, coord_x, coord_y, coord_z
     global gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list
     global isolines_xyPlane_list, isolines_xzPlane_list, isolines_yzPlane_list
 
     if gradients_volume_list != []:
         delete_objects(gradients_volume_list)
+    phase_points.visible = False
 
-    # Enabling Iso-lines button
+    # Enabling Iso-lines and Maxwell buttons
     button_isolines.disabled = False
+    button_maxwell.disabled = False
+
+    Gx_on, Gy_on, Gz_on = (gradients_strength_dict[key] != 0 for key in 'xyz')
 
     # CONDITIONALS BASED ON CURRENT SLIDERS CONFIGURATION
     # For "Gx": OFF, "Gy": OFF and "Gz": OFF
-    if (gradients_length_dict['x'] == [0, 0, 0, 0, 0]) and (gradients_length_dict['y'] == [0, 0, 0, 0, 0]) and (
-            gradients_length_dict['z'] == [0, 0, 0, 0, 0]):
+    if not (Gx_on or Gy_on or Gz_on):
         pass
 
     # For "Gx": ON, "Gy": ON and "Gz": OFF  --> Plane X-Y
-    elif (gradients_length_dict['x'] != [0, 0, 0, 0, 0]) and (gradients_length_dict['y'] != [0, 0, 0, 0, 0]) and (
-            gradients_length_dict['z'] == [0, 0, 0, 0, 0]):
-        matrix_arrow_values = []
-        positions_dict = {}
-        for idx, x in enumerate(coord_x):
-            row = []
-            for idy, y in enumerate(coord_y):
-                if (x, y) in [(-4, -4), (4, 4), (-4, 4), (4, -4)]:
-                    continue
-                else:
-                    object_opacity = 1
-
-                    arrow_value = gradients_length_dict['x'][idx] + gradients_length_dict['y'][idy]
-                    row.append(arrow_value)
-                    if arrow_value == 0:
-                        gradients_xyPlane_list.append(
-                            sphere(pos=vector(x, y, 0), radius=sphere_radio, color=COLOR_GRADIENTS,
-                                   opacity=object_opacity, pickable=False))
-                    else:
-                        gradients_xyPlane_list.append(
-                            arrow(pos=vector(x, y, 0), axis=vector(0, 0, 1), length=arrow_value,
-                                  shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS,
-                                  opacity=object_opacity, pickable=False))
-
-                    # Needed for Iso-lines: "positions_dict"
-                    # Adding new gradient object lenght as key to "positions_dict"
-                    if arrow_value not in positions_dict:
-                        positions_dict[arrow_value] = []
-
-                    # Filling "positions_dict" dictionary
-                    positions_dict[arrow_value].append(
-                        vector(x, y, 0))  # e.g. 1.5:[vector(-4, -2, 0), vector(-2, -4, 0)]
-
-                # Validation Matrix
-                matrix_arrow_values.append(row)
-
-            # Validation Matrix Adjusted
-            transposed_matrix = [[row[i] for row in matrix_arrow_values] for i in range(len(matrix_arrow_values[0]))]
-            adjusted_matrix = transposed_matrix[::-1]
-
-            '''
-            print('positions_dict: \n', positions_dict)
-            print('adjusted_matrix: \n', adjusted_matrix)
-            '''
-
-            # Calling function for Iso-lines generation
-            # Plane X-Y
-            horizontal_axis = 'y'
-            vertical_axis = 'x'
-            generate_isolines(positions_dict, horizontal_axis, vertical_axis, isolines_xyPlane_list)
-
-            # Conditional to display isolines when sliders are changed and "button_isolines" is activated
-            if button_isolines.activated == True:
-                # Showing isolines objects per plane:
-                if isolines_xyPlane_list != []:
-                    for value_element in isolines_xyPlane_list:
-                        value_element.visible = True
-                if isolines_xzPlane_list != []:
-                    for value_element in isolines_xzPlane_list:
-                        value_element.visible = True
-                if isolines_yzPlane_list != []:
-                    for value_element in isolines_yzPlane_list:
-                        value_element.visible = True
+    elif Gx_on and Gy_on and not Gz_on:
+        set_plane('xy', coord_x[:, None], coord_y[None, :], 0, gradients_xyPlane_list, isolines_xyPlane_list)
 
     # For "Gx": OFF, "Gy": ON and "Gz": ON --> Plane Y-Z
-    elif (gradients_length_dict['x'] == [0, 0, 0, 0, 0]) and (
-            (gradients_length_dict['y'] != [0, 0, 0, 0, 0]) or (gradients_length_dict['z'] != [0, 0, 0, 0, 0])):
-        matrix_arrow_values = []  ################### maybe up once, inside current function
-        positions_dict = {}  ################### maybe up once
-        for idz, z in enumerate(coord_z):
-            row = []
-            for idy, y in enumerate(coord_y):
-                arrow_value = gradients_length_dict['y'][idy] + gradients_length_dict['z'][idz]
-                # print('Value', arrow_value)
-                if arrow_value == 0:
-                    gradients_yzPlane_list.append(
-                        sphere(pos=vector(0, y, z), radius=sphere_radio, color=COLOR_GRADIENTS, pickable=False))
-                else:
-                    gradients_yzPlane_list.append(
-                        arrow(pos=vector(0, y, z), axis=vector(0, 0, 1), length=arrow_value,
-                              shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS, opacity=1,
-                              pickable=False))
-
-                # Needed for Iso-lines: "positions_dict"
-                # Adding new gradient object lenght as key to "positions_dict"
-                if arrow_value not in positions_dict:
-                    positions_dict[arrow_value] = []
-
-                # Filling "positions_dict" dictionary
-                positions_dict[arrow_value].append(
-                    vector(0, y, z))  # e.g. 1.5:[vector(-4, -2, 0), vector(-2, -4, 0)]
-
-                # Validation Matrix
-            matrix_arrow_values.append(row)
-
-        # Validation Matrix Adjusted
-        transposed_matrix = [[row[i] for row in matrix_arrow_values] for i in
-                             range(len(matrix_arrow_values[0]))]
-        adjusted_matrix = transposed_matrix[::-1]
-        '''
-        print('positions_dict: \n', positions_dict)
-        print('adjusted_matrix: \n', adjusted_matrix)
-        '''
-
-        # Calling function for Iso-lines generation
-        # Plane Y-Z
-        horizontal_axis = 'z'
-        vertical_axis = 'y'
-        generate_isolines(positions_dict, horizontal_axis, vertical_axis, isolines_yzPlane_list)
-
-        # Conditional to display isolines when sliders are changed and "button_isolines" is activated
-        if button_isolines.activated == True:
-            # Showing isolines objects per plane:
-            if isolines_xyPlane_list != []:
-                for value_element in isolines_xyPlane_list:
-                    value_element.visible = True
-            if isolines_xzPlane_list != []:
-                for value_element in isolines_xzPlane_list:
-                    value_element.visible = True
-            if isolines_yzPlane_list != []:
-                for value_element in isolines_yzPlane_list:
-                    value_element.visible = True
-
-    # For "Gx": ON, "Gy": ON and "Gz": ON
-    elif (gradients_length_dict['x'] != [0, 0, 0, 0, 0]) and (gradients_length_dict['y'] != [0, 0, 0, 0, 0]) and (
-            gradients_length_dict['z'] != [0, 0, 0, 0, 0]):
-
-        # disabling Iso-lines button
-        button_isolines.disabled = True
-
-        for idz, z in enumerate(coord_z):
-            for idx, x in enumerate(coord_x):
-                if z == 0 or x == 0:
-                    object_opacity = 1
-                else:
-                    object_opacity = 0.2
-
-                arrow_value = gradients_length_dict['x'][idx] + gradients_length_dict['z'][idz]
-                if arrow_value == 0:
-                    gradients_xzPlane_list.append(
-                        sphere(pos=vector(x, 0, z), radius=sphere_radio, color=COLOR_GRADIENTS, opacity=object_opacity,
-                               pickable=False))
-                else:
-                    gradients_xzPlane_list.append(
-                        arrow(pos=vector(x, 0, z), axis=vector(0, 0, 1), length=arrow_value,
-                              shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS, opacity=object_opacity,
-                              pickable=False))
-
-            for idy, y in enumerate(coord_y):
-                if z == 0 or y == 0:
-                    object_opacity = 1
-                else:
-                    object_opacity = 0.2
-                arrow_value = gradients_length_dict['y'][idy] + gradients_length_dict['z'][idz]
-                if arrow_value == 0:
-                    gradients_yzPlane_list.append(
-                        sphere(pos=vector(0, y, z), radius=sphere_radio, color=COLOR_GRADIENTS, opacity=object_opacity,
-                               pickable=False))
-                else:
-                    gradients_yzPlane_list.append(
-                        arrow(pos=vector(0, y, z), axis=vector(0, 0, 1), length=arrow_value,
-                              shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS, opacity=object_opacity,
-                              pickable=False))
-
-        for idx, x in enumerate(coord_x):
-            for idy, y in enumerate(coord_y):
-                if (x, y) in [(-4, -4), (4, 4), (-4, 4), (4, -4)]:
-                    continue
-                else:
-                    if x == 0 or y == 0:
-                        object_opacity = 1
-                    else:
-                        object_opacity = 0.2
-
-                    arrow_value = gradients_length_dict['x'][idx] + gradients_length_dict['y'][idy]
-                    if arrow_value == 0:
-                        gradients_xyPlane_list.append(
-                            sphere(pos=vector(x, y, 0), radius=sphere_radio, color=COLOR_GRADIENTS,
-                                   opacity=object_opacity, pickable=False))
-                    else:
-                        gradients_xyPlane_list.append(
-                            arrow(pos=vector(x, y, 0), axis=vector(0, 0, 1), length=arrow_value,
-                                  shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS,
-                                  opacity=object_opacity,
-                                  pickable=False))
+    elif not Gx_on:
+        set_plane('yz', 0, coord_y[None, :], coord_z[:, None], gradients_yzPlane_list, isolines_yzPlane_list)
+
+    # For "Gx": ON, "Gy": ON and "Gz": ON --> all three planes
+    elif Gx_on and Gy_on and Gz_on:
+        set_plane('xz', coord_x[None, :], 0, coord_z[:, None], gradients_xzPlane_list, isolines_xzPlane_list,
+                  faded=True)
+        set_plane('yz', 0, coord_y[None, :], coord_z[:, None], gradients_yzPlane_list, isolines_yzPlane_list,
+                  faded=True)
+        set_plane('xy', coord_x[:, None], coord_y[None, :], 0, gradients_xyPlane_list, isolines_xyPlane_list,
+                  faded=True)
 
     # For "Gx": ON and implicitly "Gy": OFF and "Gz": OFF or ON --> Plane X-Z
-    elif (gradients_length_dict['x'] != [0, 0, 0, 0, 0]):
-        matrix_arrow_values = []
-        positions_dict = {}
-        # positions_dict.keys() -->  List of current gradient object lengths
-        # positions_dict.values() --> positions where one can find those gradient objects with those lengths
-
-        # Loop to position gradient objects in the XZ plane
-        for idz, z in enumerate(coord_z):
-            row = []
-            for idx, x in enumerate(coord_x):
-                arrow_value = gradients_length_dict['x'][idx] + gradients_length_dict['z'][idz]
-                row.append(arrow_value)
-                if arrow_value == 0:
-                    gradients_xzPlane_list.append(
-                        sphere(pos=vector(x, 0, z), radius=sphere_radio, color=COLOR_GRADIENTS, pickable=False))
-                else:
-                    gradients_xzPlane_list.append(
-                        arrow(pos=vector(x, 0, z), axis=vector(0, 0, 1), length=arrow_value,
-                              shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS, opacity=1,
-                              pickable=False))
-
-                # Needed for Iso-lines:
-                # Adding new gradient object lenght as key to "positions_dict"
-                if arrow_value not in positions_dict:
-                    positions_dict[arrow_value] = []
-
-                # Filling "positions_dict" dictionary
-                positions_dict[arrow_value].append(
-                    vector(x, 0, z))  # e.g. -1.5: [vector(-2, 0, -8), vector(-4, 0, 8)]
-
-            # Validation Matrix
-            matrix_arrow_values.append(row)
-
-        # Validation Matrix Adjusted
-        transposed_matrix = [[row[i] for row in matrix_arrow_values] for i in range(len(matrix_arrow_values[0]))]
-        adjusted_matrix = transposed_matrix[::-1]
-        '''
-        print('positions_dict: \n', positions_dict)
-        print('adjusted_matrix: \n', adjusted_matrix)
-        '''
-
-        # Calling function for Iso-lines generation
-        # Plane X-Z
-        horizontal_axis = 'z'
-        vertical_axis = 'x'
-        generate_isolines(positions_dict, horizontal_axis, vertical_axis, isolines_xzPlane_list)
-
-        # Conditional to display isolines when sliders are changed and "button_isolines" is activated
-        if button_isolines.activated == True:
-            # Showing isolines objects per plane:
-            if isolines_xyPlane_list != []:
-                for value_element in isolines_xyPlane_list:
-                    value_element.visible = True
-            if isolines_xzPlane_list != []:
-                for value_element in isolines_xzPlane_list:
-                    value_element.visible = True
-            if isolines_yzPlane_list != []:
-                for value_element in isolines_yzPlane_list:
-                    value_element.visible = True
-
-
-    # In case no all posible slider configurations were covered
     else:
-        print("CONDITION NOT INCLUDED/SLIDERS FUNCTION/PLANE")
+        set_plane('xz', coord_x[None, :], 0, coord_z[:, None], gradients_xzPlane_list, isolines_xzPlane_list)
 
 
 def set_plot_volume(r):
-    global gradients_volume_list, gradients_length_dict, coord_x, coord_y, coord_z
+    global gradients_volume_list, gradients_strength_dict, coord_x, coord_y, coord_z
     global gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list
 
+    phase_points.visible = False
+
     # Deactivating and Disabling Iso-lines button
     button_isolines.activated = False
     button_isolines.background = color.white
     button_isolines.disabled = True
 
+    # Enabling Maxwell button
+    button_maxwell.disabled = False
+
     # Cleaning gradient plane lists:
     if gradients_xyPlane_list != []:
         delete_objects(gradients_xyPlane_list)
@@ -624,172 +577,85 @@ def set_plot_volume(r):
     if isolines_yzPlane_list != []:
         delete_objects(isolines_yzPlane_list)
 
-    for idz, z in enumerate(coord_z):
-        for idy, y in enumerate(coord_y):
-            for idx, x in enumerate(coord_x):
-                if (x, y) in [(-4, -4), (4, 4), (-4, 4), (4, -4)]:
-                    continue
-                else:
-                    if (x == 0 and y == 0) or (x == 0 and z == 0) or (y == 0 and z == 0):
-                        object_opacity = 1
-                    else:
-                        object_opacity = 0.2
-
-                    arrow_value = gradients_length_dict['x'][idx] + gradients_length_dict['y'][idy] + \
-                                  gradients_length_dict['z'][idz]
-                    if arrow_value == 0:
-                        gradients_volume_list.append(
-                            sphere(pos=vector(x, y, z), radius=0.11, color=COLOR_GRADIENTS, opacity=object_opacity,
-                                   pickable=False))
-                    else:
-                        gradients_volume_list.append(
-                            arrow(pos=vector(x, y, z), axis=vector(0, 0, 1), length=arrow_value,
-                                  shaftwidth=arrows_thickness, round=True, color=COLOR_GRADIENTS,
-                                  opacity=object_opacity, pickable=False))
-
-
-def generate_isolines(positions_dict, horizontal_axis, vertical_axis, isolines_plane_list):
-    # Setting Horizontal lower and upper bounds
-    if horizontal_axis == 'y':
-        horizontal_lower_bound = coord_y[0]  # e.g. -4
-        horizontal_upper_bound = coord_y[-1]  # e.g. 4
-    elif horizontal_axis == 'z':
-        horizontal_lower_bound = coord_z[0]  # e.g. -8
-        horizontal_upper_bound = coord_z[-1]  # # e.g. 8
-
-    vertical_lower_bound = coord_y[0]  # or =coord_x[0] (both are the same)
-    vertical_upper_bound = coord_y[-1]
-
-    initial_pos = vector(0, 0, 0)
-    final_pos = vector(0, 0, 0)
-
-    # Loop for Iso-Lines Generation
-    for a_value, positions in positions_dict.items():
-        # Evaluating if each "a_value" (i.e. object_lenght) is at least twice to draw the iso-line
-
-        if len(positions) > 1:
-            # Validation
-            # print(a_value, 'positions: ', positions)
-
-            # Conditionals according to the position of the initial and final position of that "a_value"
-            # Case 1: where the initial and final position are at the scaner limits.
-            # if positions[0].z == -8 and positions[-1].z == 8:
-            if (getattr(positions[0], horizontal_axis) == horizontal_lower_bound and getattr(positions[-1],
-                                                                                             horizontal_axis) == horizontal_upper_bound) or (
-                    getattr(positions[0], vertical_axis) == vertical_lower_bound and getattr(positions[-1],
-                                                                                             vertical_axis) == vertical_upper_bound):
-                isolines_plane_list.append(
-                    cylinder(pos=positions[0], axis=positions[-1] - positions[0], radius=0.05, color=COLOR_ISOLINES,
-                             visible=False))
-
-            # Case 2: where the initial position is NOT at the scaner limits but the final position is.
-            # elif positions[0].z != -8 and positions[-1].z == 8:
-            elif getattr(positions[0], horizontal_axis) != horizontal_lower_bound and getattr(positions[-1],
-                                                                                              horizontal_axis) == horizontal_upper_bound:
-                slope = (getattr(positions[-1], vertical_axis) - getattr(positions[0], vertical_axis)) / (
-                        getattr(positions[-1], horizontal_axis) - getattr(positions[0], horizontal_axis))
-                b = getattr(positions[0], vertical_axis) - slope * getattr(positions[0], horizontal_axis)
-                initial_vertical = slope * horizontal_lower_bound + b
-
-                if initial_vertical > 0 and initial_vertical >= vertical_upper_bound:
-                    initial_horizontal = (vertical_upper_bound - b) / slope
-                    # initial_pos = vector(vertical_upper_bound, 0, initial_z) ###########
-                    setattr(initial_pos, horizontal_axis, initial_horizontal)
-                    setattr(initial_pos, vertical_axis, vertical_upper_bound)
-
-                elif initial_vertical < 0 and initial_vertical <= vertical_lower_bound:
-                    initial_horizontal = (vertical_lower_bound - b) / slope
-                    # initial_pos = vector(vertical_lower_bound, 0, initial_z)  ###########
-                    setattr(initial_pos, horizontal_axis, initial_horizontal)
-                    setattr(initial_pos, vertical_axis, vertical_lower_bound)
-
-                else:
-                    # initial_pos = vector(initial_x, 0, -8) ##########
-                    setattr(initial_pos, horizontal_axis, horizontal_lower_bound)
-                    setattr(initial_pos, vertical_axis, initial_vertical)
-
-                isolines_plane_list.append(
-                    cylinder(pos=initial_pos, axis=positions[-1] - initial_pos, radius=0.05, color=COLOR_ISOLINES,
-                             visible=False))
-
-            # Case 3: where the initial position is at the scaner limits but the final position is NOT.
-            # elif positions[0].z == -8 and positions[-1].z != 8:
-            elif getattr(positions[0], horizontal_axis) == horizontal_lower_bound and getattr(positions[-1],
-                                                                                              horizontal_axis) != horizontal_upper_bound:
-
-                slope = (getattr(positions[-1], vertical_axis) - getattr(positions[0], vertical_axis)) / (
-                        getattr(positions[-1], horizontal_axis) - getattr(positions[0], horizontal_axis))
-                b = getattr(positions[0], vertical_axis) - slope * getattr(positions[0], horizontal_axis)
-                final_vertical = slope * horizontal_upper_bound + b
-
-                if final_vertical < 0 and final_vertical <= vertical_lower_bound:
-                    final_horizontal = (vertical_lower_bound - b) / slope
-                    # final_pos = vector(vertical_lower_bound, 0, final_horizontal)
-                    setattr(final_pos, horizontal_axis, final_horizontal)
-                    setattr(final_pos, vertical_axis, vertical_lower_bound)
-
-                elif final_vertical > 0 and final_vertical >= vertical_upper_bound:
-                    final_horizontal = (vertical_upper_bound - b) / slope
-                    # final_pos = vector(vertical_upper_bound, 0, final_horizontal)
-                    setattr(final_pos, horizontal_axis, final_horizontal)
-                    setattr(final_pos, vertical_axis, vertical_upper_bound)
-
-                else:
-                    # final_pos = vector(final_vertical, 0, 8)
-                    setattr(final_pos, horizontal_axis, horizontal_upper_bound)
-                    setattr(final_pos, vertical_axis, final_vertical)
-
-                isolines_plane_list.append(
-                    cylinder(pos=positions[0], axis=final_pos - positions[0], radius=0.05, color=COLOR_ISOLINES,
-                             visible=False))
-
-            # Case 4: where the initial and final position are NOT at the scaner limits.
-            else:
-                slope = (getattr(positions[-1], vertical_axis) - getattr(positions[0], vertical_axis)) / (
-                        getattr(positions[-1], horizontal_axis) - getattr(positions[0], horizontal_axis))
-                b = getattr(positions[0], vertical_axis) - slope * getattr(positions[0], horizontal_axis)
-                initial_vertical = slope * horizontal_lower_bound + b
-                final_vertical = slope * horizontal_upper_bound + b
-                # initial_x = slope * -8 + b
-                # final_x = slope * 8 + b
-
-                if initial_vertical > 0 and initial_vertical >= vertical_upper_bound:
-                    initial_horizontal = (vertical_upper_bound - b) / slope
-                    # initial_pos = vector(vertical_upper_bound, 0, initial_z)
-                    setattr(initial_pos, horizontal_axis, initial_horizontal)
-                    setattr(initial_pos, vertical_axis, vertical_upper_bound)
-
-                elif initial_vertical < 0 and initial_vertical <= vertical_lower_bound:
-                    initial_horizontal = (vertical_lower_bound - b) / slope
-                    # initial_pos = vector(vertical_lower_bound, 0, initial_z)
-                    setattr(initial_pos, horizontal_axis, initial_horizontal)
-                    setattr(initial_pos, vertical_axis, vertical_lower_bound)
-
-                else:
-                    # initial_pos = vector(initial_x, 0, -8)
-                    setattr(initial_pos, horizontal_axis, horizontal_lower_bound)
-                    setattr(initial_pos, vertical_axis, initial_vertical)
-
-                if final_vertical < 0 and final_vertical <= vertical_lower_bound:
-                    final_horizontal = (vertical_lower_bound - b) / slope
-                    # final_pos = vector(vertical_lower_bound, 0, final_horizontal)
-                    setattr(final_pos, horizontal_axis, final_horizontal)
-                    setattr(final_pos, vertical_axis, vertical_lower_bound)
-
-                elif final_vertical > 0 and final_vertical >= vertical_upper_bound:
-                    final_horizontal = (vertical_upper_bound - b) / slope
-                    # final_pos = vector(vertical_upper_bound, 0, final_horizontal)
-                    setattr(final_pos, horizontal_axis, final_horizontal)
-                    setattr(final_pos, vertical_axis, vertical_upper_bound)
-
-                else:
-                    # final_pos = vector(final_vertical, 0, 8)
-                    setattr(final_pos, horizontal_axis, horizontal_upper_bound)
-                    setattr(final_pos, vertical_axis, final_vertical)
-
-                isolines_plane_list.append(
-                    cylinder(pos=initial_pos, axis=final_pos - initial_pos, radius=0.05, color=COLOR_ISOLINES,
-                             visible=False))
+    draw_volume()
+
+
+def volume_level():
+    # Stride of the volume view and whether it is drawn as points. Arrows need MIN_ARROW_PIXELS on the screen (from
+    # the camera distance), room for their length (from the field magnitude) and at most MAX_VOLUME_ARROWS objects
+    distance = mag(scene.camera.pos - scene.center)
+    pixels_per_unit = scene.height / (2 * distance * tan(scene.fov / 2))
+    spacing = min(volume_x[1] - volume_x[0], volume_y[1] - volume_y[0], volume_z[1] - volume_z[0])
+    corners = display_field(*lattice(volume_x[[0, -1]], volume_y[[0, -1]], volume_z[[0, -1]]))
+    longest_arrow = np.abs(corners).max()
+
+    if VOLUME_POINTS and VOLUME_STRIDES[-1] * spacing * pixels_per_unit < MIN_ARROW_PIXELS:
+        # Too far away for arrows: every sample that the screen resolves as one point
+        for stride in VOLUME_STRIDES:
+            if stride * spacing * pixels_per_unit >= MIN_POINT_PIXELS:
+                return stride, True
+        return VOLUME_STRIDES[-1], True
+
+    for stride in VOLUME_STRIDES:
+        if (stride * spacing * pixels_per_unit >= MIN_ARROW_PIXELS
+                and longest_arrow <= ARROW_OVERLAP * stride * (volume_z[1] - volume_z[0])
+                and (VOLUME_INTERVALS // stride + 1) ** 3 <= MAX_VOLUME_ARROWS):
+            return stride, False
+    return VOLUME_STRIDES[-1], False
+
+
+current_volume_level = None
+
+
+def draw_volume():
+    global current_volume_level
+    # Field of the strided sample grid in one evaluation (cached per configuration and level of detail); arrows off
+    # the axis planes are faded, spheres shrink with the stride
+    current_volume_level = volume_level()
+    stride, as_points = current_volume_level
+    geometry = render_cache.get_or_compute(
+        render_key('volume') + current_volume_level,
+        lambda: lattice_geometry(*lattice(volume_x[::stride], volume_y[::stride], volume_z[::stride]), faded=True))
+
+    if as_points:
+        positions, arrow_values, opacities = geometry
+        volume_points.clear()
+        volume_points.append([{'pos': vector(*position), 'color': vector(*rgb)}
+                              for position, rgb in zip(positions.tolist(), field_colors(arrow_values).tolist())])
+        volume_points.visible = True
+        gradients_volume_list.append(volume_points)
+    else:
+        show_lattice(geometry, gradients_volume_list, radius=0.11 * stride / VOLUME_STRIDES[-1])
+    if button_maxwell.activated == True:
+        # Without arrows among the points, but the largest deviation is still evaluated for the displayed value
+        positions = geometry[0]
+        show_maxwell(positions, maxwell_geometry(render_key('volume') + current_volume_level, positions),
+                     gradients_volume_list, arrows=not as_points)
+
+
+def isoline_geometry(x, y, z, arrow_values):
+    # Polylines (arrays of points) of the iso-lines of the field on the plane lattice (x, y, z broadcast to 2-D
+    # arrays), at the arrow lengths of the displayed gradient objects. The lowest and highest levels are moved inwards
+    # by a negligible amount so that iso-lines along the border of the lattice are found as well
+    levels = np.unique(arrow_values)
+    if len(levels) < 2:
+        return []
+    margin = 1E-9 * (levels[-1] - levels[0])
+    levels = np.clip(levels, levels[0] + margin, levels[-1] - margin)
+
+    x, y, z = np.broadcast_arrays(x, y, z)
+    level_lines = isolines(display_field(x, y, z), np.stack((x, y, z), axis=-1), levels)
+    return [line for lines in level_lines for line in lines]
+
+
+def show_isolines(polylines, isolines_plane_list):
+    # One pooled curve per (cached) iso-line polyline
+    for line in polylines:
+        isoline = isoline_pool.get((id(isolines_plane_list), len(isolines_plane_list)))
+        isoline.clear()
+        isoline.append([vector(*point) for point in line.tolist()])
+        isoline.visible = True
+        isolines_plane_list.append(isoline)
 
 
 def visualize_isolines():
@@ -818,16 +684,115 @@ def visualize_isolines():
         button_isolines.background = color.green
         button_isolines.activated = True
 
-        # Showing isolines objects per plane:
-        if isolines_xyPlane_list != []:
-            for value_element in isolines_xyPlane_list:
-                value_element.visible = True
-        if isolines_xzPlane_list != []:
-            for value_element in isolines_xzPlane_list:
-                value_element.visible = True
-        if isolines_yzPlane_list != []:
-            for value_element in isolines_yzPlane_list:
-                value_element.visible = True
+        # Redrawing the planes with isolines (computed now, or taken from the cache):
+        if radio_plane.checked == True:
+            for object_list in [gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list,
+                                isolines_xyPlane_list, isolines_xzPlane_list, isolines_yzPlane_list]:
+                delete_objects(object_list)
+            set_plot_plane(radio_plane)
+
+
+def visualize_maxwell():
+    global gradients_volume_list
+
+    # Toggling the button
+    if button_maxwell.activated:
+        button_maxwell.background = color.white
+        button_maxwell.activated = False
+        wtext_maxwell.text = ''
+    else:
+        button_maxwell.background = COLOR_MAXWELL
+        button_maxwell.activated = True
+
+    # Redrawing the current mode with or without the concomitant field layer
+    if radio_plane.checked == True:
+        for object_list in [gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list,
+                            isolines_xyPlane_list, isolines_xzPlane_list, isolines_yzPlane_list]:
+            delete_objects(object_list)
+        set_plot_plane(radio_plane)
+    elif radio_volume.checked == True:
+        delete_objects(gradients_volume_list)
+        draw_volume()
+
+
+# PHASE ENCODING <-----------------------------------------------------------------------------------------------------
+# Phase-encoding steps n = -N/2, ..., N/2 - 1 along y: gradient lobes G_y = n*dG of duration PE_TAU over a field of
+# view PE_FOV (mapped onto the x-y plane of the lattice), sampled at the PE_MATRIX pixels along y and PE_COLUMNS along x
+PE_FOV = 0.25  # m
+PE_MATRIX = 256
+PE_TAU = 1E-3  # s
+PE_COLUMNS = 32
+pe_gradients = phase_encoding_gradients(PE_FOV, PE_MATRIX, PE_TAU)
+pe_x = ((np.arange(PE_COLUMNS) + 0.5) / PE_COLUMNS - 0.5) * PE_FOV
+pe_y = ((np.arange(PE_MATRIX) + 0.5) / PE_MATRIX - 0.5) * PE_FOV
+phase_positions = [vector(x, y, 0) for y in pe_y * 2 * coord_y[-1] / PE_FOV for x in pe_x * 2 * coord_x[-1] / PE_FOV]
+phase_points = points(radius=2, visible=False, pickable=False)
+
+# The phase stack and its colors have their own budget, so that switching between the other views (render_cache) does
+# not evict them and stepping through the phase-encoding steps stays a lookup
+PHASE_CACHE_BYTES = 64 * 2 ** 20
+phase_cache = LRUCache(PHASE_CACHE_BYTES)
+
+
+def phase_stack():
+    # Phase maps exp(-i*gamma*(G.r)*tau) of all phase-encoding steps in one call, cached per (FOV, matrix size, tau)
+    return phase_cache.get_or_compute(
+        ('phase encoding', PE_FOV, PE_MATRIX, PE_TAU),
+        lambda: phase_maps(pe_gradients[:, None] * [0, 1, 0], pe_x[None, :], pe_y[:, None], 0, PE_TAU))
+
+
+def phase_colors(phase_stack):
+    # RGB rows on a color wheel for the phases of a (complex) stack of phase maps, shape (n_steps, n_points, 3)
+    phase = np.angle(phase_stack).reshape(len(phase_stack), -1, 1)
+    return 0.5 + 0.5 * np.cos(phase - np.array([0, 2 * np.pi / 3, -2 * np.pi / 3]))
+
+
+def phase_color_stack():
+    # RGB rows of the phase maps of all steps (n_steps, n_points, 3), computed once from the cached stack
+    return phase_cache.get_or_compute(
+        ('phase encoding colors', PE_FOV, PE_MATRIX, PE_TAU),
+        lambda: phase_colors(phase_stack()).astype(np.float32))
+
+
+def set_phase_step(s):
+    n = int(s.value)
+    wtext_pe.text = '{} (G<sub>y</sub> = {:1.2f} mT/m)'.format(n, pe_gradients[n + PE_MATRIX // 2] * 1E3)
+    if not radio_phase.checked:
+        return
+
+    # Map of step n, looked up in the cached colors: the points are placed once, a step only recolors them
+    colors = phase_color_stack()[n + PE_MATRIX // 2].tolist()
+    if phase_points.npoints == 0:
+        phase_points.append([{'pos': position, 'color': vector(*rgb)}
+                             for position, rgb in zip(phase_positions, colors)])
+    else:
+        for k, rgb in enumerate(colors):
+            phase_points.modify(k, color=vector(*rgb))
+    phase_points.visible = True
+
+
+def set_plot_phase(r):
+    # Deactivating and Disabling Iso-lines button
+    button_isolines.activated = False
+    button_isolines.background = color.white
+    button_isolines.disabled = True
+
+    # Deactivating and Disabling Maxwell button
+    button_maxwell.activated = False
+    button_maxwell.background = color.white
+    button_maxwell.disabled = True
+    wtext_maxwell.text = ''
+
+    # Hiding the gradient objects of the other modes
+    for key in gradients_object_dict:
+        if gradients_object_dict[key] is not None:
+            for element in gradients_object_dict[key]:
+                element.visible = False
+    for object_list in [gradients_xyPlane_list, gradients_xzPlane_list, gradients_yzPlane_list, gradients_volume_list,
+                        isolines_xyPlane_list, isolines_xzPlane_list, isolines_yzPlane_list]:
+        delete_objects(object_list)
+
+    set_phase_step(slider_pe)
 
 
 # PLOT in:
@@ -841,10 +806,22 @@ radio_plane = radio(bind=set_plot_plane, text='Plane', checked=False, name='plot
 scene.append_to_caption('      ')
 button_isolines = button(bind=visualize_isolines, text='Show Iso-lines', background=color.white, disabled=True,
                          activated=False)
+scene.append_to_caption('  ')
+button_maxwell = button(bind=visualize_maxwell, text='Show Maxwell terms', background=color.white, disabled=True,
+                        activated=False)
+wtext_maxwell = wtext(text='')
 
 scene.append_to_caption('\n      ')
 radio_volume = radio(bind=set_plot_volume, text='Volume', checked=False, name='plot')
 
+scene.append_to_caption('\n      ')
+radio_phase = radio(bind=set_plot_phase, text='Phase encoding', checked=False, name='plot')
+scene.append_to_caption('\n      n:')
+slider_pe = slider(min=-(PE_MATRIX // 2), max=PE_MATRIX // 2 - 1, value=0, length=220, bind=set_phase_step, right=15,
+                   step=1, disabled=False)
+wtext_pe = wtext(text='')
+set_phase_step(slider_pe)
+
 
 # VIEWS FUNCTION
 def set_views(r):
@@ -900,3 +877,8 @@ radio(bind=set_views, text='Free rotation', checked=False, name='views')
 # Keeps the 3D scene alive and updates the animation at 30 FPS
 while True:
     rate(30)
+
+    # Level of detail of the volume view follows the camera (zoom)
+    if radio_volume.checked and volume_level() != current_volume_level:
+        delete_objects(gradients_volume_list)
+        draw_volume()
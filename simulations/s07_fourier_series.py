@@ -12,6 +12,10 @@ https://creativecommons.org/licenses/by-sa/4.0/
 """
 
 from vpython import *
+import numpy as np
+from engine.fourier import (PartialSums, fft_coefficients, fft_partial_sum, periodic_grid, periodic_samples,
+                            ramp_coefficients, sign_coefficients)
+from engine.plotting import curve_points
 # --- Web VPython (Glowscript) required version declaration ---
 # Web VPython 3.2
 
@@ -47,6 +51,7 @@ gp_cn = graph(width=window_innerWidth * 0.6, height=window_innerHeight * 0.6 / 2
               xtitle='n', ytitle='c<sub>n</sub>', scroll=False, fast=False, align='left')
 cn = gdots(color=color.red, label='<i>Im(c<sub>n</sub>)</i>', graph=gp_cn)
 cn_bars = gvbars(delta=0.05, color=color.red, graph=gp_cn)
+cn_re = gdots(color=color.blue, label='<i>Re(c<sub>n</sub>)</i>', graph=gp_cn)
 
 '''
 However, due to the Gibbs phenomenon, oscillations near 
@@ -81,10 +86,27 @@ scene.append_to_caption('''
    <b>Simulation Interaction:</b>
     Below, you can selected the function f(x) and the number
     of terms (N) to use for the Fourier series approximation.
+    The user-defined f(x) (CUSTOM_FUNCTION in the code: a
+    function, an array of samples or a .npy file) is expanded
+    with coefficients computed by FFT; its real parts are
+    shown in blue.
     \n''')
 
 # Fourier Series Parameters
 L = 5  # Length of the interval
+NUM_POINTS = 1000
+x_values = np.linspace(-L / 2, L / 2, NUM_POINTS)
+partial_sums = None  # s_N(x) of the selected function for every N of the slider
+
+# User-defined f(x): a Python callable, an array of samples over [-L/2, L/2) or the path of a .npy file
+# Define f(x) = triangle of width 1
+def f_custom(x):
+    return np.clip(1 - 2 * np.abs(x), 0, None)
+
+
+CUSTOM_FUNCTION = f_custom  # e.g. 'profile.npy'
+CUSTOM_SAMPLES = 2 ** 16  # Samples of a callable over one period
+custom_coefficients = None  # c_0, ..., c_N of the user-defined f(x), from an FFT
 
 
 # Define f(x) = x
@@ -94,74 +116,42 @@ def f_x(x):
 
 # Define f(x) = sign(x)
 def f_sign(x):
-    return 1 if x >= 0 else -1
-
+    return np.where(x >= 0, 1, -1)
 
-def fourier_series_sign(x, N):
-    S_N = 0
-    for n in range(1, N + 1, 2):  # Solo términos impares
-        S_N += (4 / (n * pi)) * sin(n * x)
-    return S_N
 
-
-def fourier_series_x(x, N):
-    sum_terms = 0
-    for n in range(1, N + 1):
-        cn = cn_x(n)
-        # Real Part: cn * cos(2 * pi * n * x / L)
-        sum_terms += cn * sin(2 * pi * n * x / L) * (-1)
-    return sum_terms
+# Selected function and its Fourier coefficients c_n (complex)
+def selected_function():
+    if radio_sign.checked:
+        return f_sign, sign_coefficients
+    elif radio_x.checked:
+        return f_x, ramp_coefficients
+    return None, None
 
 
 def set_function(r):
-    x_min = -2.5
-    x_max = 2.5
-    num_points = 1000
-    step_size = (x_max - x_min) / (num_points - 1)
-
+    global partial_sums, custom_coefficients
     # Clean up the graphs
     fx.delete()
-    sN.delete()
-    cn.delete()
-    cn_bars.delete()
-
-    if r.example == 'A':
-        for i in range(num_points):
-            # f(x)
-            x = x_min + i * step_size
-            y = f_sign(x)
-            fx.plot(x, y)
-
-            # Fourier Series
-            sN.plot(x, fourier_series_sign(x, slider_n.value))
-
 
-    elif r.example == 'B':
-        L = 5  # mm
-        for i in range(num_points):
-            x = x_min + i * step_size
-            y = x / L
-            fx.plot(x, y)
+    if radio_custom.checked:
+        # Samples of f(x) over one period and their coefficients by FFT
+        samples = periodic_samples(CUSTOM_FUNCTION, L, CUSTOM_SAMPLES)
+        custom_coefficients = fft_coefficients(samples, int(slider_n.max))
+        partial_sums = None
 
-            # Fourier Series
-            sN.plot(x, fourier_series_x(x, slider_n.value))
-
-    set_n(slider_n)
-
-
-def cn_sign(n):
-    if n == 0:
-        return 0  # El coeficiente para n = 0 se define como 0
+        # f(x), thinned out to about the number of points of the graph
+        step = max(1, len(samples) // NUM_POINTS)
+        fx.plot(curve_points(periodic_grid(len(samples), L)[::step], samples[::step]))
     else:
-        Im = (1 - pow(-1, n)) / (n * pi) * (-1)
-        return Im
+        # f(x), handed to the graph as one list of points
+        f, coefficients = selected_function()
+        fx.plot(curve_points(x_values, f(x_values)))
 
+        # Partial sums for all N up to the slider maximum, replacing those of the previous function
+        partial_sums = PartialSums(x_values, coefficients(np.arange(int(slider_n.max) + 1)), L)
 
-def cn_x(n):
-    if n == 0:
-        return 0  # The coefficient for n = 0 is zero in this case
-    else:
-        return (1 / (1 * n * pi)) * pow(-1, (n + 1)) * (-1)
+    # Fourier Series and coefficients
+    set_n(slider_n)
 
 
 # Function selection radiobuttons
@@ -170,67 +160,55 @@ scene.append_to_caption('      ')
 radio_sign = radio(example='A', bind=set_function, text='f(x) = sign(x)', checked=False, name='function')
 scene.append_to_caption('\n      ')
 radio_x = radio(example='B', bind=set_function, text='f(x) = x/L', checked=False, name='function')
+scene.append_to_caption('\n      ')
+radio_custom = radio(example='C', bind=set_function, text='f(x) user-defined (FFT)', checked=False, name='function')
 
 
 # scene.append_to_caption('\n      ')
 
 
 def set_n(s):
-    coefficients_Im = []
-    n_values = arange(-s.value, s.value + 1)
+    wtext_n.text = s.value
+    if partial_sums is None and not radio_custom.checked:
+        return
 
     # Clean Previous Graphs
     sN.delete()
     cn.delete()
     cn_bars.delete()
+    cn_re.delete()
+
+    if radio_custom.checked:
+        # Coefficients c_-N, ..., c_N from c_-n = conj(c_n) (N is limited by the number of samples)
+        coefficients = custom_coefficients[:int(s.value) + 1]
+        N = len(coefficients) - 1
+        c_values = np.concatenate((np.conj(coefficients[:0:-1]), coefficients))
+        cn_re.plot(curve_points(np.arange(-N, N + 1), c_values.real))
+
+        # Fourier Series s_N(x) by inverse FFT, closed periodically at x = L/2
+        s_N = fft_partial_sum(coefficients, NUM_POINTS, L)
+        x_s_N = np.append(periodic_grid(NUM_POINTS, L), L / 2)
+        s_N = np.append(s_N, s_N[0])
+    else:
+        # Coefficients c_-N, ..., c_N (only the imaginary part is non-zero for odd functions)
+        f, coefficients = selected_function()
+        N = int(s.value)
+        c_values = coefficients(np.arange(-N, N + 1))
 
-    if radio_sign.checked:
-        for n in n_values:
-            coefficients_Im.append(cn_sign(n))
-        paired_values = list(zip(n_values, coefficients_Im))
-        cn.plot(paired_values)
-        cn_bars.plot(paired_values)
-        wtext_n.text = s.value
-
-        x_min = -2.5
-        x_max = 2.5
-        num_points = 1000
-        step_size = (x_max - x_min) / (num_points - 1)
-
-        sN.delete()  # Limpiar gráfica anterior
-        for i in range(num_points):
-            # f(x)
-            x = x_min + i * step_size
-
-            # Fourier Series
-            sN.plot(x, fourier_series_sign(x, slider_n.value))
-
-    elif radio_x.checked:
-        for n in n_values:
-            coefficients_Im.append(cn_x(n))
-        paired_values = list(zip(n_values, coefficients_Im))
-        cn.plot(paired_values)
-        cn_bars.plot(paired_values)
-        wtext_n.text = s.value
-
-        x_min = -2.5
-        x_max = 2.5
-        num_points = 1000
-        step_size = (x_max - x_min) / (num_points - 1)
-
-        sN.delete()  # Limpiar gráfica anterior
-        for i in range(num_points):
-            # f(x)
-            x = x_min + i * step_size
+        # Fourier Series s_N(x), looked up in the partial sums of the selected function
+        s_N = partial_sums[N]
+        x_s_N = x_values
 
-            # Fourier Series
-            sN.plot(x, fourier_series_x(x, slider_n.value))
+    paired_values = curve_points(np.arange(-N, N + 1), c_values.imag)
+    cn.plot(paired_values)
+    cn_bars.plot(paired_values)
+    sN.plot(curve_points(x_s_N, s_N))
 
 
 # Slider for number of coefficients
 scene.append_to_caption('\n\n    Number of Terms:\n')
 scene.append_to_caption('      N:')
-slider_n = slider(min=1, max=20, value=1, length=220, bind=set_n, right=15, step=1,
+slider_n = slider(min=1, max=2000, value=1, length=220, bind=set_n, right=15, step=1,
                   disabled=False, text='0')
 wtext_n = wtext(text=slider_n.value)
 